@@ -0,0 +1,248 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from foodgram.utils import LRUCache
+from monitoring.metrics import CACHE_EVENTS
+
+CACHE_SETTINGS = {
+    "CACHE_ALIAS": "default",
+    "LOCAL_MAX_SIZE": 2048,
+    "LOCAL_TTL": 5,
+    "LOCK_TIMEOUT": 10,
+    "KEY_PREFIX": "fg",
+}
+CACHE_SETTINGS.update(getattr(settings, "LAYERED_CACHE", {}))
+
+
+class LayeredCache(object):
+    """
+    Two-level cache: a per-process LRU in front of the shared
+    Django cache backend (local memory or file based).
+
+    Values are stored with the time they stay fresh and are kept
+    in the shared backend for 'stale_ttl' seconds longer. A stale value
+    is returned at once while one thread rebuilds it in the background.
+    A missing value is built by one worker only: the others wait
+    for the result instead of running the same queries.
+
+    Keys live in namespaces (usually the label of a model) with
+    a version, so bumping the version on save invalidates all keys
+    of the namespace at once.
+    """
+    EVENTS = ("local_hits", "shared_hits", "stale_hits",
+              "misses", "builds", "coalesced")
+
+    def __init__(self, alias, local_max_size, local_ttl,
+                 lock_timeout, key_prefix):
+        self.alias = alias
+        self.local = LRUCache(max_size=local_max_size, ttl=local_ttl)
+        self.lock_timeout = lock_timeout
+        self.key_prefix = key_prefix
+        self.counters = dict.fromkeys(self.EVENTS, 0)
+        self._counters_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def count(self, event):
+        with self._counters_lock:
+            self.counters[event] += 1
+        CACHE_EVENTS.labels("layered", event).inc()
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache events in this process
+        and the ratio of the requests served from the cache.
+        """
+        with self._counters_lock:
+            stats = dict(self.counters)
+        hits = (stats["local_hits"] + stats["shared_hits"]
+                + stats["stale_hits"] + stats["coalesced"])
+        total = hits + stats["misses"]
+        stats["hit_ratio"] = hits / total if total else 0.0
+        return stats
+
+    def namespace_version(self, namespace) -> int:
+        key = f"{self.key_prefix}:ns:{namespace}"
+        version = self.local.get(key)
+        if version is None:
+            version = self.shared.get(key)
+            if version is None:
+                self.shared.add(key, 1, None)
+                version = self.shared.get(key, 1)
+            self.local.set(key, version)
+        return version
+
+    def bump(self, namespace):
+        """
+        Invalidates all keys of the namespace.
+        """
+        key = f"{self.key_prefix}:ns:{namespace}"
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.set(key, 2, None)
+        self.local.delete(key)
+
+    def make_key(self, namespace, key) -> str:
+        version = self.namespace_version(namespace)
+        return f"{self.key_prefix}:{namespace}:v{version}:{key}"
+
+    def get_or_set(self, namespace, key, builder, ttl, stale_ttl=0):
+        """
+        Returns the cached value for the key or builds it.
+
+        Args:
+            namespace: Namespace of the key.
+            key: Key in the namespace.
+            builder: Function without arguments that builds the value.
+            ttl: Number of seconds the value is fresh.
+            stale_ttl: Number of seconds after ttl while the stale
+                value is returned during the rebuild.
+
+        Returns:
+            The cached or the built value.
+
+        """
+        full_key = self.make_key(namespace, key)
+        entry = self.local.get(full_key)
+        if entry is not None and entry[1] > time.time():
+            self.count("local_hits")
+            return entry[0]
+
+        entry = self.shared.get(full_key)
+        if entry is not None:
+            self.local.set(full_key, entry)
+            if entry[1] > time.time():
+                self.count("shared_hits")
+                return entry[0]
+            self.count("stale_hits")
+            if self._acquire(full_key):
+                threading.Thread(
+                    target=self._refresh,
+                    args=(full_key, builder, ttl, stale_ttl),
+                    daemon=True
+                ).start()
+            return entry[0]
+
+        self.count("misses")
+        with self._local_lock(full_key):
+            entry = self.local.get(full_key) or self.shared.get(full_key)
+            if entry is not None:
+                self.count("coalesced")
+                return entry[0]
+            if not self._acquire(full_key):
+                entry = self._wait(full_key)
+                if entry is not None:
+                    self.count("coalesced")
+                    return entry[0]
+            try:
+                return self._build(full_key, builder, ttl, stale_ttl)
+            finally:
+                self._release(full_key)
+
+    def _build(self, full_key, builder, ttl, stale_ttl):
+        self.count("builds")
+        value = builder()
+        entry = (value, time.time() + ttl)
+        self.shared.set(full_key, entry, ttl + stale_ttl)
+        self.local.set(full_key, entry)
+        return value
+
+    def _refresh(self, full_key, builder, ttl, stale_ttl):
+        try:
+            self._build(full_key, builder, ttl, stale_ttl)
+        finally:
+            self._release(full_key)
+            connections.close_all()
+
+    def _acquire(self, full_key) -> bool:
+        return self.shared.add(f"{full_key}:lock", 1, self.lock_timeout)
+
+    def _release(self, full_key):
+        self.shared.delete(f"{full_key}:lock")
+
+    def _wait(self, full_key):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.shared.get(full_key)
+            if entry is not None:
+                self.local.set(full_key, entry)
+                return entry
+        return None
+
+    def _local_lock(self, full_key):
+        return self._locks[hash(full_key) % len(self._locks)]
+
+
+def shared_cache():
+    """
+    Returns the cache backend seen by every worker ('SHARED_CACHE_ALIAS'),
+    for the state that must not differ between the processes.
+    """
+    return caches[settings.SHARED_CACHE_ALIAS]
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES[settings.SHARED_CACHE_ALIAS]["BACKEND"]
+    if backend.endswith("LocMemCache"):
+        return [checks.Warning(
+            f"The '{settings.SHARED_CACHE_ALIAS}' cache keeps its data "
+            "in the memory of one process, so the workers do not share "
+            "revoked tokens and other state.",
+            hint="Use a file based, memcached or redis cache backend.",
+            id="foodgram.W001",
+        )]
+    return []
+
+
+cache = LayeredCache(
+    alias=CACHE_SETTINGS["CACHE_ALIAS"],
+    local_max_size=CACHE_SETTINGS["LOCAL_MAX_SIZE"],
+    local_ttl=CACHE_SETTINGS["LOCAL_TTL"],
+    lock_timeout=CACHE_SETTINGS["LOCK_TIMEOUT"],
+    key_prefix=CACHE_SETTINGS["KEY_PREFIX"],
+)
+
+
+def model_namespace(model) -> str:
+    return model._meta.label_lower
+
+
+def user_namespace(user_id) -> str:
+    """
+    Namespace of the cached data that depends on the state
+    of the user (favorites, shopping list, subscriptions).
+    """
+    return f"user:{user_id}"
+
+
+def register_model_namespace(model, *related_models):
+    """
+    Bumps the cache namespace of the model when its instances
+    or their many-to-many links are changed, and when instances
+    of the related models (e.g. custom through models) are changed.
+    """
+    namespace = model_namespace(model)
+
+    def bump(sender, **kwargs):
+        if kwargs.get("action", "post").startswith("post"):
+            cache.bump(namespace)
+
+    for sender in (model,) + related_models:
+        post_save.connect(bump, sender=sender, weak=False)
+        post_delete.connect(bump, sender=sender, weak=False)
+    for field in model._meta.many_to_many:
+        m2m_changed.connect(
+            bump, sender=field.remote_field.through, weak=False
+        )
@@ -0,0 +1,187 @@
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# SQLSTATE of the statement cancelled by statement_timeout in PostgreSQL
+QUERY_CANCELED = "57014"
+
+
+class QueryTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The request took too long, please try again later."
+    default_code = "query_timeout"
+
+
+def behind_pooler(connection) -> bool:
+    # session settings would leak to the other clients of the pooler
+    return bool(connection.settings_dict.get("DISABLE_SERVER_SIDE_CURSORS"))
+
+
+def timeout_marker():
+    """
+    On-commit callback marking the transactions where
+    'StatementTimeoutSetter' set the timeout.
+    """
+
+
+class StatementTimeoutSetter(object):
+    """
+    Database execute wrapper that sets statement_timeout
+    of the PostgreSQL session before the first query of the request
+    on every connection, and resets it after the request.
+
+    Behind a transaction pooler the timeout is set with SET LOCAL
+    in every transaction of the request: the queries outside of
+    a transaction run in one opened by the setter until the end
+    of the request.
+    """
+
+    def __init__(self, get_timeout):
+        self.get_timeout = get_timeout
+        self.connections = []
+        self.transactions = ExitStack()
+        self.own_transactions = []
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context["connection"]
+        if behind_pooler(connection):
+            self.set_local(connection)
+        elif connection not in self.connections:
+            self.connections.append(connection)
+            self.run(connection, "SET statement_timeout = %s",
+                     [int(self.get_timeout())])
+        return execute(sql, params, many, context)
+
+    def run(self, connection, command, params=None):
+        with connection.connection.cursor() as cursor:
+            cursor.execute(command, params)
+
+    def set_local(self, connection):
+        if not connection.in_atomic_block:
+            self.transactions.enter_context(
+                transaction.atomic(using=connection.alias)
+            )
+            self.own_transactions.append(connection.alias)
+        # the marker is dropped with the transaction or the savepoint,
+        # as is the setting
+        if not any(func is timeout_marker
+                   for _, func in connection.run_on_commit):
+            transaction.on_commit(timeout_marker, using=connection.alias)
+            self.run(connection, "SET LOCAL statement_timeout = %s",
+                     [int(self.get_timeout())])
+
+    def rollback(self):
+        # the exceptions answered by the view never reach the transactions
+        for alias in self.own_transactions:
+            transaction.set_rollback(True, using=alias)
+
+    def reset(self):
+        self.transactions.close()
+        for connection in self.connections:
+            if connection.connection is None:
+                continue
+            try:
+                self.run(connection, "SET statement_timeout TO DEFAULT")
+            except connection.Database.Error:
+                # the broken connection is closed before the next request
+                connection.close()
+
+
+class StatementTimeoutMixin:
+    """
+    Viewset mixin limiting the time of every SQL statement of the action
+    to 'statement_timeouts[action]' milliseconds (DB_STATEMENT_TIMEOUT
+    by default). A cancelled statement is answered with 503.
+
+    Only PostgreSQL is supported. Behind a transaction pooler the action
+    runs in transactions (see 'StatementTimeoutSetter'), rolled back
+    when it fails.
+
+    """
+    statement_timeouts = {}
+
+    def get_statement_timeout(self):
+        return self.statement_timeouts.get(
+            getattr(self, "action", None), settings.DB_STATEMENT_TIMEOUT
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        # the action is resolved by the time of the first query
+        self.timeout_setter = StatementTimeoutSetter(
+            self.get_statement_timeout
+        )
+        with ExitStack() as stack:
+            for connection in connections.all():
+                if connection.vendor == "postgresql":
+                    stack.enter_context(
+                        connection.execute_wrapper(self.timeout_setter)
+                    )
+            try:
+                return super().dispatch(request, *args, **kwargs)
+            finally:
+                self.timeout_setter.reset()
+
+    def handle_exception(self, exc):
+        if hasattr(self, "timeout_setter"):
+            self.timeout_setter.rollback()
+        if isinstance(exc, OperationalError) and getattr(
+                exc.__cause__, "pgcode", None) == QUERY_CANCELED:
+            exc = QueryTimeout()
+        return super().handle_exception(exc)
+
+
+def settled_before(seconds):
+    """
+    Returns the time before which the rows stamped at the insert
+    or update are complete. A transaction still in flight commits rows
+    stamped with the time it wrote them, so a cursor or a checkpoint
+    that moved past that time would miss them: the readers stop
+    'seconds' before now, longer than the transactions run.
+    """
+    return timezone.now() - timedelta(seconds=seconds)
+
+
+def estimate_count(queryset):
+    """
+    Returns the number of rows of the table of an unfiltered queryset
+    from the statistics of PostgreSQL (pg_class.reltuples, updated by
+    VACUUM and ANALYZE), or None when there is no estimate.
+    """
+    connection = connections[queryset.db]
+    if (connection.vendor != "postgresql" or queryset.query.where
+            or queryset.query.distinct):
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # -1 stands for a table that was never analyzed
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator of the admin changelists of the large tables: the number
+    of the rows of an unfiltered list is estimated (see 'estimate_count')
+    instead of running COUNT(*) over the whole table. Filtered lists
+    and the tables smaller than 'estimate_threshold' are counted.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
@@ -0,0 +1,103 @@
+import random
+import threading
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.cache import shared_cache
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != "default"]
+
+
+def set_replica_reads(enabled: bool):
+    """
+    Picks the replica for the reads of the current request, so that
+    all of them see the same snapshot despite the different lag
+    of the replicas.
+    """
+    replicas = replica_aliases() if enabled else None
+    _state.replica = random.choice(replicas) if replicas else None
+
+
+def get_replica():
+    return getattr(_state, "replica", None)
+
+
+def get_sticky_key(user_id) -> str:
+    return f"db-sticky:{user_id}"
+
+
+def mark_sticky(user_id):
+    """
+    Sends the reads of the user to the primary database
+    for REPLICA_STICKY_SECONDS after the write,
+    so that the user sees their changes despite the replication lag.
+    The marker is kept in the shared cache to be seen by every worker.
+    """
+    shared_cache().set(
+        get_sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS
+    )
+
+
+def is_sticky(user_id) -> bool:
+    return shared_cache().get(get_sticky_key(user_id)) is not None
+
+
+class PrimaryReplicaRouter(object):
+    """
+    Sends the reads to the replica picked for the current request
+    by ReplicaReadMixin, and all the other queries to the primary
+    ('default') database.
+    """
+
+    def db_for_read(self, model, **hints):
+        return get_replica() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaReadMixin:
+    """
+    Viewset mixin that enables replica reads for the safe requests
+    of users who didn't write anything during the sticky window.
+
+    The actions in 'replica_write_actions' are writes
+    even when they are called with GET.
+
+    """
+    replica_write_actions = ()
+
+    def is_write_request(self, request) -> bool:
+        return (request.method not in SAFE_METHODS
+                or getattr(self, "action", None) in self.replica_write_actions)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if not self.is_write_request(request) and (
+                user.is_anonymous or not is_sticky(user.pk)):
+            set_replica_reads(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        set_replica_reads(False)
+        if (self.is_write_request(request) and response.status_code < 400
+                and request.user.is_authenticated):
+            mark_sticky(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            set_replica_reads(False)
@@ -0,0 +1,279 @@
+import math
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connections
+from django.http import JsonResponse
+
+from monitoring.metrics import (DB_CONNECTIONS_REUSED,
+                                DB_HEALTH_CHECK_FAILURES, REQUESTS_SHED)
+
+
+class DatabaseHealthCheckMiddleware(object):
+    """
+    Checks the persistent database connections before the request
+    (at most once per DB_HEALTH_CHECK_INTERVAL seconds) and closes
+    the broken ones, e.g. after a restart of the database,
+    so that the request opens a new connection instead of failing.
+
+    The connections belong to the threads of the worker, so the time
+    of the last check is kept on every connection.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        now = time.monotonic()
+        for connection in connections.all():
+            if connection.connection is None:
+                continue
+            alias = connection.alias
+            # (DB-API connection, time): a reopened connection is new
+            checked, checked_at = getattr(
+                connection, "health_checked", (None, 0)
+            )
+            if checked is connection.connection and now - checked_at < (
+                    settings.DB_HEALTH_CHECK_INTERVAL):
+                DB_CONNECTIONS_REUSED.labels(alias).inc()
+                continue
+            connection.health_checked = (connection.connection, now)
+            if connection.is_usable():
+                DB_CONNECTIONS_REUSED.labels(alias).inc()
+            else:
+                DB_HEALTH_CHECK_FAILURES.labels(alias).inc()
+                connection.close()
+        return self.get_response(request)
+
+
+class CircuitBreaker(object):
+    """
+    Per-process circuit breaker of the database.
+
+    The outcomes of the SQL statements are counted in one-second
+    buckets over the last 'WINDOW' seconds. When there are at least
+    'MIN_QUERIES' statements and the share of failed or slow
+    (longer than 'SLOW_QUERY' seconds) ones crosses its threshold,
+    the breaker opens for 'COOLDOWN' seconds. Then one probe request
+    is let through: the breaker closes if its statements succeed.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window, min_queries, error_rate, slow_rate,
+                 slow_query, cooldown):
+        self.window = window
+        self.min_queries = min_queries
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_query = slow_query
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def record(self, duration, failed):
+        second = int(time.monotonic())
+        with self.lock:
+            bucket = self.buckets.setdefault(second, [0, 0, 0])
+            bucket[0] += 1
+            bucket[1] += failed
+            bucket[2] += duration > self.slow_query
+            if self.state == self.CLOSED:
+                self._check(second)
+
+    def _check(self, second):
+        total = errors = slow = 0
+        for key in list(self.buckets):
+            if key <= second - self.window:
+                del self.buckets[key]
+                continue
+            total += self.buckets[key][0]
+            errors += self.buckets[key][1]
+            slow += self.buckets[key][2]
+        if total >= self.min_queries and (
+                errors / total >= self.error_rate
+                or slow / total >= self.slow_rate):
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.buckets.clear()
+
+    def allow(self):
+        """
+        Returns (allowed, is_probe, seconds to wait).
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True, False, 0
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                return False, False, remaining
+            if self.probing:
+                return False, False, 1
+            self.state = self.HALF_OPEN
+            self.probing = True
+            return True, True, 0
+
+    def finish_probe(self, success):
+        with self.lock:
+            self.probing = False
+            if success:
+                self.state = self.CLOSED
+            else:
+                self._open()
+
+
+class CircuitBreakerMiddleware(object):
+    """
+    Answers the API requests with 503 and Retry-After at once
+    while the database circuit breaker is open,
+    instead of keeping the workers waiting for a failing database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = settings.DB_CIRCUIT_BREAKER
+        self.breaker = CircuitBreaker(
+            window=options["WINDOW"],
+            min_queries=options["MIN_QUERIES"],
+            error_rate=options["ERROR_RATE"],
+            slow_rate=options["SLOW_RATE"],
+            slow_query=options["SLOW_QUERY"],
+            cooldown=options["COOLDOWN"],
+        )
+
+    def __call__(self, request):
+        if not request.path.startswith("/api/"):
+            return self.get_response(request)
+        allowed, is_probe, retry_after = self.breaker.allow()
+        if not allowed:
+            response = JsonResponse(
+                {"detail": "Service is temporarily unavailable."},
+                status=503
+            )
+            response["Retry-After"] = max(int(math.ceil(retry_after)), 1)
+            return response
+
+        failures = []
+
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                result = execute(sql, params, many, context)
+            except (OperationalError, InterfaceError):
+                # failures of the database itself: broken connections,
+                # timeouts; not the errors of the data (IntegrityError)
+                failures.append(sql)
+                self.breaker.record(time.perf_counter() - start, True)
+                raise
+            self.breaker.record(time.perf_counter() - start, False)
+            return result
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(wrapper))
+                response = self.get_response(request)
+        finally:
+            if is_probe:
+                self.breaker.finish_probe(not failures)
+        return response
+
+
+def get_queue_delay(request):
+    """
+    Returns the seconds the request waited after nginx received it,
+    from the 'X-Request-Start: t=<seconds>' header, or None.
+    """
+    value = request.META.get("HTTP_X_REQUEST_START", "")
+    try:
+        started = float(value[2:] if value.startswith("t=") else value)
+    except ValueError:
+        return None
+    # the header may hold milliseconds or microseconds
+    while started > 1e11:
+        started /= 1000
+    return max(time.time() - started, 0)
+
+
+class AdmissionControlMiddleware(object):
+    """
+    Sheds load early when the worker is overloaded.
+
+    Every view has a priority: 'admission_priorities[action]'
+    or 'admission_priority' of the viewset ('normal' by default).
+    A request is answered with 503 and Retry-After before the view
+    runs when it waited in the queue longer than the target delay
+    of its priority, or when the worker already processes
+    the maximum number of requests of its priority, so that cheap
+    high-priority reads are served before exports and bulk writes.
+
+    The requests in flight are counted per worker process, among
+    the threads of its pool (gthread workers, see gunicorn.conf.py):
+    the low-priority requests can't take all the threads of a process.
+    """
+    PRIORITIES = ("high", "normal", "low")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = settings.ADMISSION_CONTROL
+        self.max_in_flight = options["MAX_IN_FLIGHT"]
+        self.max_queue_delay = options["MAX_QUEUE_DELAY"]
+        self.retry_after = options["RETRY_AFTER"]
+        self.in_flight = dict.fromkeys(self.PRIORITIES, 0)
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        request.admission_priority = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request.admission_priority is not None:
+                with self.lock:
+                    self.in_flight[request.admission_priority] -= 1
+
+    @staticmethod
+    def get_priority(view_func, method):
+        cls = getattr(view_func, "cls", None)
+        if cls is None:
+            return "normal"
+        actions = getattr(view_func, "actions", None) or {}
+        action = actions.get(method.lower())
+        priorities = getattr(cls, "admission_priorities", {})
+        return priorities.get(
+            action, getattr(cls, "admission_priority", "normal")
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not request.path.startswith("/api/"):
+            return None
+        priority = self.get_priority(view_func, request.method)
+        delay = get_queue_delay(request)
+        if delay is not None and delay > self.max_queue_delay[priority]:
+            return self.reject(priority, "queue_delay")
+        with self.lock:
+            if self.in_flight[priority] >= self.max_in_flight[priority]:
+                rejected = True
+            else:
+                rejected = False
+                self.in_flight[priority] += 1
+        if rejected:
+            return self.reject(priority, "concurrency")
+        request.admission_priority = priority
+        return None
+
+    def reject(self, priority, reason):
+        REQUESTS_SHED.labels(priority, reason).inc()
+        response = JsonResponse(
+            {"detail": "Server is overloaded, please try again later."},
+            status=503
+        )
+        response["Retry-After"] = self.retry_after
+        return response
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -28,16 +29,23 @@ THIRD_PARTY_APPS = [
 LOCAL_APPS = [
     'users',
     'recipes',
+    'monitoring',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
+    'monitoring.querystats.QueryStatsMiddleware',
+    'foodgram.middleware.AdmissionControlMiddleware',
+    'foodgram.middleware.CircuitBreakerMiddleware',
+    'foodgram.middleware.DatabaseHealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'monitoring.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -72,9 +80,134 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # persistent connections, closed after this number of seconds
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Behind a transaction pooler (PgBouncer in 'transaction' mode)
+# a session may change the server connection between transactions,
+# so server-side cursors of iterator() can't be used.
+if os.environ.get('DB_POOLER_MODE') == 'transaction':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Seconds between the checks of a persistent connection before the request
+DB_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_HEALTH_CHECK_INTERVAL', 10))
+
+# Default limit of an SQL statement in milliseconds,
+# the viewsets set their own limits in 'statement_timeouts'
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000))
+
+# Threads of a gunicorn worker process (see gunicorn.conf.py)
+WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Load shedding by the priority of the view: maximum number of requests
+# in flight per worker process, out of its WORKER_THREADS threads, and
+# maximum seconds of waiting in the nginx queue (X-Request-Start header)
+ADMISSION_CONTROL = {
+    'MAX_IN_FLIGHT': {
+        'high': WORKER_THREADS,
+        'normal': max(1, WORKER_THREADS * 3 // 4),
+        'low': max(1, WORKER_THREADS // 4),
+    },
+    'MAX_QUEUE_DELAY': {'high': 10.0, 'normal': 3.0, 'low': 1.0},
+    'RETRY_AFTER': 5,
+}
+
+# Fail fast with 503 when the database fails or slows down
+DB_CIRCUIT_BREAKER = {
+    'WINDOW': 10,
+    'MIN_QUERIES': 20,
+    'ERROR_RATE': 0.5,
+    'SLOW_RATE': 0.5,
+    'SLOW_QUERY': 2.0,
+    'COOLDOWN': int(os.environ.get('DB_CIRCUIT_BREAKER_COOLDOWN', 15)),
+}
+
+# Read replicas: comma-separated hosts of the PostgreSQL replicas,
+# or names of the database files for SQLite.
+DB_REPLICAS = [
+    replica for replica in os.environ.get('DB_REPLICAS', '').split(',')
+    if replica
+]
+for index, replica in enumerate(DB_REPLICAS):
+    replica_field = (
+        'NAME' if 'sqlite' in (DATABASES['default']['ENGINE'] or '')
+        else 'HOST'
+    )
+    DATABASES[f'replica_{index}'] = dict(
+        DATABASES['default'],
+        **{replica_field: replica},
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['foodgram.db_routers.PrimaryReplicaRouter']
+
+# Seconds during which the reads of the user go to the primary after a write
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# Files written by the running server (caches, query stats, profiles,
+# indexes), kept out of the source tree
+RUNTIME_DIR = os.environ.get(
+    'RUNTIME_DIR', os.path.join(tempfile.gettempdir(), 'foodgram')
+)
+
+# Shared cache of the workers: local memory by default,
+# 'django.core.cache.backends.filebased.FileBasedCache'
+# with a directory in CACHE_LOCATION to share it between processes.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'foodgram'),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+# Cache for the state that must be the same in every worker (revoked
+# tokens, sticky reads from the primary): files on the host by default,
+# memcached or another network cache when the server runs on several hosts
+SHARED_CACHE_ALIAS = 'shared'
+CACHES[SHARED_CACHE_ALIAS] = {
+    'BACKEND': os.environ.get(
+        'SHARED_CACHE_BACKEND',
+        'django.core.cache.backends.filebased.FileBasedCache'
+    ),
+    'LOCATION': os.environ.get(
+        'SHARED_CACHE_LOCATION',
+        os.path.join(RUNTIME_DIR, 'cache')
+    ),
+    'TIMEOUT': None,
+    'OPTIONS': {
+        'MAX_ENTRIES': int(
+            os.environ.get('SHARED_CACHE_MAX_ENTRIES', 100000)
+        ),
+    },
+}
+
+# Counters of the throttles, local to the worker process: the rates
+# of DEFAULT_THROTTLE_RATES are per worker, so a client spread over
+# the GUNICORN_WORKERS processes gets up to that many times the rate
+# (the shared cache would cost a file write per request and its
+# increments are not atomic)
+THROTTLE_CACHE_ALIAS = 'throttle'
+CACHES[THROTTLE_CACHE_ALIAS] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'throttle',
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+}
+
+LAYERED_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'LOCAL_MAX_SIZE': int(os.environ.get('LAYERED_CACHE_LOCAL_SIZE', 2048)),
+    'LOCAL_TTL': int(os.environ.get('LAYERED_CACHE_LOCAL_TTL', 5)),
+    'LOCK_TIMEOUT': int(os.environ.get('LAYERED_CACHE_LOCK_TIMEOUT', 10)),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -96,18 +229,56 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'foodgram.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'foodgram.renderers.MessagePackRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'foodgram.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'foodgram.renderers.MessagePackParser',
     ],
 
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
 
+    'DEFAULT_THROTTLE_CLASSES': [
+        'recipes.throttling.ActionScopedThrottle',
+    ],
+
+    # per worker process, see THROTTLE_CACHE_ALIAS
+    'DEFAULT_THROTTLE_RATES': {
+        'favorite': '120/min',
+        'shopping_cart': '120/min',
+        'subscribe': '60/min',
+        'batch': '30/min',
+        'recipe_write': '20/min',
+        'download': '10/min',
+    },
+
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6
 }
 
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000)),
+    'LOCAL_TTL': int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', 10)),
+    # seconds a token revoked in another worker may still be accepted
+    'VERSION_TTL': int(os.environ.get('TOKEN_AUTH_VERSION_TTL', 2)),
+    'TTL': int(os.environ.get('TOKEN_AUTH_TTL', 300)),
+    'CACHE_ALIAS': os.environ.get(
+        'TOKEN_AUTH_CACHE_ALIAS', SHARED_CACHE_ALIAS
+    ),
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'PASSWORD_RESET_CONFIRM_URL': 'users/reset_password/{uid}/{token}',
@@ -133,6 +304,52 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.AppUser'
 
+# Aggregates of the SQL statements by fingerprint and view,
+# see the 'query_report' management command
+QUERY_STATS = {
+    'DIR': os.environ.get(
+        'QUERY_STATS_DIR', os.path.join(RUNTIME_DIR, 'query_stats')
+    ),
+    'FLUSH_INTERVAL': int(os.environ.get('QUERY_STATS_FLUSH_INTERVAL', 60)),
+    'MAX_BYTES': int(os.environ.get('QUERY_STATS_MAX_BYTES', 10485760)),
+    'BACKUP_COUNT': int(os.environ.get('QUERY_STATS_BACKUP_COUNT', 5)),
+}
+
+# Profiles of the requests of staff users sent with the 'X-Profile' header
+PROFILER = {
+    'DIR': os.environ.get(
+        'PROFILER_DIR', os.path.join(RUNTIME_DIR, 'profiles')
+    ),
+    'MAX_RECORDS': int(os.environ.get('PROFILER_MAX_RECORDS', 50)),
+    # seconds between the samples of the stack of the request
+    'INTERVAL': float(os.environ.get('PROFILER_INTERVAL', 0.005)),
+}
+
+# Popularity ranking of the recipes, see the 'update_popularity'
+# management command which should run every few minutes
+POPULARITY = {
+    'HALF_LIFE_DAYS': float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', 7)),
+    'FAVORITE_WEIGHT': 1.0,
+    'SHOPPING_LIST_WEIGHT': 0.5,
+}
+
+# Days the deleted recipes stay in the changes feed: older tombstones
+# are removed by 'process_deletions', and the feed refuses the tokens
+# older than that (the clients start the sync again)
+CHANGES_RETENTION_DAYS = int(os.environ.get('CHANGES_RETENTION_DAYS', 30))
+
+# Matrix recipe x ingredient for the similar recipes, see the
+# 'build_ingredient_index' management command which should run
+# periodically (the recipes changed since the build are read from the db)
+INGREDIENT_INDEX = {
+    'DIR': os.environ.get(
+        'INGREDIENT_INDEX_DIR', os.path.join(RUNTIME_DIR, 'ingredient_index')
+    ),
+    'CHECK_INTERVAL': int(
+        os.environ.get('INGREDIENT_INDEX_CHECK_INTERVAL', 5)
+    ),
+}
+
 AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
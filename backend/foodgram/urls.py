@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from monitoring.views import metrics
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics, name="metrics"),
     path("api/auth/", include("djoser.urls.authtoken")),
     path("api/", include("recipes.urls")),
 ]
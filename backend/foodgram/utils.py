@@ -1,4 +1,7 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 from uuid import uuid4
 
 from django.conf import settings
@@ -18,3 +21,58 @@ class ImageUploadToFactory(object):
         ext = filename.split(".")[-1] if "." in filename else "unknown"
         path = os.path.join(str(instance.id or 0), "%s.%s" % (uuid4(), ext))
         return os.path.join(self.parent, path)
+
+
+class LRUCache(object):
+    """
+    Thread-safe in-process cache with a limited number of entries,
+    where the least recently used entries are evicted first
+    and every entry expires after its time to live.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_many(self, predicate):
+        """
+        Removes all entries whose value satisfies the predicate.
+        """
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items()
+                    if predicate(value)]
+            for key in keys:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,81 @@
+import io
+import os
+import pstats
+
+from django.contrib import admin
+from django.contrib.admin.decorators import register
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import ProfileRecord
+
+
+@register(ProfileRecord)
+class ProfileRecordAdmin(admin.ModelAdmin):
+    """
+    Browsing of the request profiles in the Django admin panel:
+    timings of the phases, top functions and the pstats file.
+
+    """
+    list_display = ("created", "method", "path", "view", "status",
+                    "total_time", "db_time", "db_queries", "render_time",
+                    "download_link",)
+    list_filter = ("view", "method",)
+    search_fields = ("path", "view",)
+    list_select_related = ("user",)
+    readonly_fields = ("created", "user", "method", "path", "view", "status",
+                       "total_time", "view_time", "db_time", "db_queries",
+                       "serialization_time", "render_time", "download_link",
+                       "top_functions",)
+    fieldsets = (
+        ("request",
+         {"fields": (("method", "status",), "path", "view",
+                     ("user", "created",))}),
+        ("timings",
+         {"fields": (("total_time", "view_time",),
+                     ("db_time", "db_queries",),
+                     ("serialization_time", "render_time",))}),
+        ("profile",
+         {"fields": ("download_link", "top_functions",)}),
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download),
+                name="monitoring_profilerecord_download",
+            ),
+        ] + super().get_urls()
+
+    def download(self, request, pk):
+        record = self.get_object(request, pk)
+        if record is None or not os.path.exists(record.stats_path):
+            raise Http404
+        return FileResponse(
+            open(record.stats_path, "rb"),
+            as_attachment=True,
+            filename=record.stats_file
+        )
+
+    @admin.display(description="pstats file")
+    def download_link(self, obj):
+        url = reverse("admin:monitoring_profilerecord_download", args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.stats_file)
+
+    @admin.display(description="serialization time, ms")
+    def serialization_time(self, obj):
+        return round(obj.serialization_time, 2)
+
+    @admin.display(description="top functions")
+    def top_functions(self, obj):
+        if not os.path.exists(obj.stats_path):
+            return "-"
+        stream = io.StringIO()
+        stats = pstats.Stats(obj.stats_path, stream=stream)
+        stats.sort_stats("cumulative").print_stats(40)
+        return format_html("<pre>{}</pre>", stream.getvalue())
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from monitoring.querystats import percentile, query_stats, read_stats
+
+SORT_KEYS = {
+    "total": lambda item: item["total"],
+    "count": lambda item: item["count"],
+    "mean": lambda item: item["mean"],
+    "p95": lambda item: item["p95"],
+}
+
+
+class Command(BaseCommand):
+    help = "Print the slowest SQL statements by fingerprint and view"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top", type=int, default=20,
+            help="Number of statements to print."
+        )
+        parser.add_argument(
+            "--sort", choices=sorted(SORT_KEYS), default="total",
+            help="Sort by total time, count, mean or p95 time."
+        )
+        parser.add_argument(
+            "--by-view", action="store_true",
+            help="Keep the statements of different views apart."
+        )
+        parser.add_argument(
+            "--dir", default=settings.QUERY_STATS["DIR"],
+            help="Directory of the query statistics files."
+        )
+
+    def handle(self, *args, **options):
+        query_stats.flush()
+        rows = {}
+        for (sql, view), (count, total, buckets) in read_stats(
+                options["dir"]).items():
+            key = (sql, view if options["by_view"] else "*")
+            row = rows.setdefault(key, {
+                "fingerprint": sql, "view": key[1], "count": 0,
+                "total": 0.0, "buckets": [0] * len(buckets),
+            })
+            row["count"] += count
+            row["total"] += total
+            for index, bucket in enumerate(buckets):
+                row["buckets"][index] += bucket
+
+        for row in rows.values():
+            row["mean"] = row["total"] / row["count"]
+            row["p95"] = percentile(row["buckets"], 0.95)
+        top = sorted(
+            rows.values(), key=SORT_KEYS[options["sort"]], reverse=True
+        )[:options["top"]]
+
+        if not top:
+            self.stdout.write("No query statistics found.")
+            return
+        for row in top:
+            self.stdout.write(
+                f"total {row['total'] * 1000:10.1f} ms  "
+                f"count {row['count']:8d}  "
+                f"mean {row['mean'] * 1000:8.2f} ms  "
+                f"p95 <= {row['p95'] * 1000:8.2f} ms  "
+                f"view {row['view']}"
+            )
+            self.stdout.write(f"    {row['fingerprint']}")
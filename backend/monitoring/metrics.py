@@ -0,0 +1,83 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest)
+from prometheus_client import multiprocess
+
+# The metric files of the process are opened as the metrics are created,
+# also by the management commands run outside of gunicorn
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Buckets of the request latency and the time spent in the database.
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+REQUEST_LATENCY = Histogram(
+    "foodgram_request_duration_seconds",
+    "Duration of the request by view and action.",
+    ["view", "method", "status"],
+    buckets=TIME_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "foodgram_request_db_queries",
+    "Number of database queries per request.",
+    ["view"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "foodgram_request_db_duration_seconds",
+    "Time spent in the database per request.",
+    ["view"],
+    buckets=TIME_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "foodgram_requests_in_flight",
+    "Number of requests being processed.",
+    multiprocess_mode="livesum",
+)
+REQUESTS_SHED = Counter(
+    "foodgram_requests_shed_total",
+    "Requests rejected by the admission control.",
+    ["priority", "reason"],
+)
+DB_CONNECTIONS_CREATED = Counter(
+    "foodgram_db_connections_created_total",
+    "New connections to the database.",
+    ["alias"],
+)
+DB_CONNECTIONS_REUSED = Counter(
+    "foodgram_db_connections_reused_total",
+    "Requests that reused an open connection to the database.",
+    ["alias"],
+)
+DB_HEALTH_CHECK_FAILURES = Counter(
+    "foodgram_db_health_check_failures_total",
+    "Broken persistent connections closed before the request.",
+    ["alias"],
+)
+CACHE_EVENTS = Counter(
+    "foodgram_cache_events_total",
+    "Cache lookups by cache and result.",
+    ["cache", "event"],
+)
+
+
+def is_multiprocess() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render_metrics():
+    """
+    Returns the metrics in the text exposition format.
+    With PROMETHEUS_MULTIPROC_DIR set (gunicorn with several workers)
+    the values of all worker processes are read from their files
+    in this directory and aggregated.
+    """
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return generate_latest(registry), CONTENT_TYPE_LATEST
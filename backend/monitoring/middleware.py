@@ -0,0 +1,72 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import (REQUEST_DB_TIME, REQUEST_LATENCY, REQUEST_QUERIES,
+                      REQUESTS_IN_FLIGHT)
+
+
+def get_view_name(view_func, method) -> str:
+    """
+    Returns the name of the view with the action for viewsets,
+    e.g. 'RecipeViewSet.list' or 'RecipeViewSet.favorite'.
+    """
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f"{cls.__name__}.{action}"
+
+
+class QueryCounter(object):
+    """
+    Database execute wrapper counting the queries and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware(object):
+    """
+    Records the latency, the number of database queries
+    and the database time of every request by view and action,
+    and the number of requests in flight.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_view = "unresolved"
+        counter = QueryCounter()
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                response = self.get_response(request)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+        view = request.metrics_view
+        REQUEST_LATENCY.labels(
+            view, request.method, response.status_code
+        ).observe(time.perf_counter() - start)
+        REQUEST_QUERIES.labels(view).observe(counter.count)
+        REQUEST_DB_TIME.labels(view).observe(counter.duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_name(view_func, request.method)
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('method', models.CharField(max_length=10, verbose_name='method')),
+                ('path', models.CharField(max_length=2000, verbose_name='path')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='view')),
+                ('status', models.PositiveIntegerField(default=0, verbose_name='status')),
+                ('total_time', models.FloatField(default=0, verbose_name='total time, ms')),
+                ('view_time', models.FloatField(default=0, verbose_name='view time, ms')),
+                ('db_time', models.FloatField(default=0, verbose_name='database time, ms')),
+                ('db_queries', models.PositiveIntegerField(default=0, verbose_name='database queries')),
+                ('render_time', models.FloatField(default=0, verbose_name='render time, ms')),
+                ('stats_file', models.CharField(max_length=255, verbose_name='pstats file')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profile_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'request profile',
+                'verbose_name_plural': 'request profiles',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+import os
+
+from django.conf import settings
+from django.db import models
+
+
+class ProfileRecord(models.Model):
+    """
+    Result of the profiling of one request by a staff user.
+    The profiler statistics are stored in the pstats file,
+    the model keeps the timings of the request phases.
+    """
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="created"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="profile_records"
+    )
+    method = models.CharField(
+        max_length=10,
+        verbose_name="method"
+    )
+    path = models.CharField(
+        max_length=2000,
+        verbose_name="path"
+    )
+    view = models.CharField(
+        max_length=200,
+        verbose_name="view",
+        blank=True
+    )
+    status = models.PositiveIntegerField(
+        verbose_name="status",
+        default=0
+    )
+    total_time = models.FloatField(
+        verbose_name="total time, ms",
+        default=0
+    )
+    view_time = models.FloatField(
+        verbose_name="view time, ms",
+        default=0
+    )
+    db_time = models.FloatField(
+        verbose_name="database time, ms",
+        default=0
+    )
+    db_queries = models.PositiveIntegerField(
+        verbose_name="database queries",
+        default=0
+    )
+    render_time = models.FloatField(
+        verbose_name="render time, ms",
+        default=0
+    )
+    stats_file = models.CharField(
+        max_length=255,
+        verbose_name="pstats file"
+    )
+
+    class Meta:
+        verbose_name = "request profile"
+        verbose_name_plural = "request profiles"
+        app_label = "monitoring"
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.total_time:.0f} ms)"
+
+    @property
+    def serialization_time(self):
+        """
+        Time of the view spent outside of the database:
+        serialization and the other Python code of the view.
+        """
+        return max(self.view_time - self.db_time, 0)
+
+    @property
+    def stats_path(self):
+        return os.path.join(settings.PROFILER["DIR"], self.stats_file)
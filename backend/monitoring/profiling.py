@@ -0,0 +1,264 @@
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+
+from users.authentication import CachedTokenAuthentication
+
+from .middleware import QueryCounter, get_view_name
+from .models import ProfileRecord
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "_profile"
+
+
+def get_staff_user(request):
+    """
+    Returns the staff user of the request authenticated
+    by the session (admin) or by the API token, otherwise None.
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = result[0] if result else None
+    if user is not None and user.is_staff:
+        return user
+    return None
+
+
+class RequestProfile(object):
+    """
+    Timings of the phases of the profiled request.
+    """
+
+    def __init__(self):
+        self.queries = QueryCounter()
+        self.view = ""
+        self.view_start = None
+        self.view_time = 0.0
+        self.render_time = 0.0
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler of the thread which enables it: a background
+    thread records the stack of that thread (from the function which
+    called enable()) every 'interval' seconds, so the profiled code
+    runs at full speed instead of being traced call by call like with
+    cProfile. Short functions are missed or counted roughly, the time
+    of the slow ones is exact enough.
+
+    The samples are dumped in the pstats format: every sample counts
+    the time since the previous one (at least 'interval', longer when
+    the profiled thread holds the GIL) for each function on the stack,
+    and the number of the calls is the number of the samples.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        # number and time of the samples of every stack
+        # of (file, first line, function) from the caller of enable()
+        self.samples = Counter()
+        self.times = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.thread_id = None
+        # frames of the stack outside the function calling enable()
+        self.outer_frames = 0
+
+    def enable(self):
+        self.thread_id = threading.get_ident()
+        frame = sys._getframe(2)
+        self.outer_frames = 0
+        while frame is not None:
+            self.outer_frames += 1
+            frame = frame.f_back
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="profiler", daemon=True
+        )
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    (code.co_filename, code.co_firstlineno, code.co_name)
+                )
+                frame = frame.f_back
+            stack = tuple(reversed(stack))[self.outer_frames:]
+            if stack:
+                self.samples[stack] += 1
+                self.times[stack] += elapsed
+
+    def create_stats(self) -> dict:
+        """
+        Returns the samples as the statistics of pstats:
+        {function: (primitive calls, calls, own time, cumulative time,
+        {caller: (calls, primitive calls, own time, cumulative time)})}.
+        """
+        stats = {}
+        for stack, count in self.samples.items():
+            seconds = self.times[stack]
+            seen = set()
+            for depth, function in enumerate(stack):
+                entry = stats.setdefault(function, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                if leaf:
+                    entry[2] += seconds
+                # the recursive calls are counted once per sample
+                if function not in seen:
+                    seen.add(function)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if depth:
+                    caller = entry[4].setdefault(
+                        stack[depth - 1], [0, 0, 0.0, 0.0]
+                    )
+                    caller[0] += count
+                    caller[1] += count
+                    caller[2] += seconds if leaf else 0.0
+                    caller[3] += seconds
+        return {
+            function: (cc, nc, tt, ct, {
+                caller: tuple(values) for caller, values in callers.items()
+            })
+            for function, (cc, nc, tt, ct, callers) in stats.items()
+        }
+
+    def dump_stats(self, path):
+        with open(path, "wb") as stats_file:
+            marshal.dump(self.create_stats(), stats_file)
+
+
+class ProfilerMiddleware(object):
+    """
+    Profiles the request with the sampling profiler (see
+    'SamplingProfiler') when a staff user sends the 'X-Profile'
+    header or the '_profile' query parameter.
+
+    The pstats dump is written to PROFILER['DIR'] (it can be opened
+    with snakeviz or converted to a flamegraph with flameprof),
+    and the timings are saved as ProfileRecord for the admin.
+    Only the last PROFILER['MAX_RECORDS'] profiles are kept.
+    Requests without the flag are passed through untouched.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_HEADER not in request.META and (
+                PROFILE_PARAM not in request.GET):
+            return self.get_response(request)
+        user = get_staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        request.profile = RequestProfile()
+        profiler = SamplingProfiler(settings.PROFILER["INTERVAL"])
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(request.profile.queries)
+                )
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        total_time = time.perf_counter() - start
+
+        record = self.save(request, response, user, profiler, total_time)
+        response["X-Profile-Id"] = record.id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, "profile", None)
+        if profile is not None:
+            profile.view = get_view_name(view_func, request.method)
+            profile.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        """
+        DRF responses are rendered after the view returns:
+        the view phase ends here and the rendering is timed.
+        """
+        profile = getattr(request, "profile", None)
+        if profile is None:
+            return response
+        if profile.view_start is not None:
+            profile.view_time = time.perf_counter() - profile.view_start
+            profile.view_start = None
+        render = response.render
+
+        def timed_render():
+            start = time.perf_counter()
+            try:
+                return render()
+            finally:
+                profile.render_time += time.perf_counter() - start
+
+        response.render = timed_render
+        return response
+
+    def save(self, request, response, user, profiler, total_time):
+        profile = request.profile
+        if profile.view_start is not None:
+            profile.view_time = time.perf_counter() - profile.view_start
+        directory = settings.PROFILER["DIR"]
+        os.makedirs(directory, exist_ok=True)
+        stats_file = f"{uuid4().hex}.prof"
+        profiler.dump_stats(os.path.join(directory, stats_file))
+
+        record = ProfileRecord.objects.create(
+            user_id=user.pk,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view=profile.view,
+            status=response.status_code,
+            total_time=total_time * 1000,
+            view_time=profile.view_time * 1000,
+            db_time=profile.queries.duration * 1000,
+            db_queries=profile.queries.count,
+            render_time=profile.render_time * 1000,
+            stats_file=stats_file,
+        )
+        self.trim()
+        return record
+
+    @staticmethod
+    def trim():
+        """
+        Deletes the oldest profiles over the limit with their files.
+        """
+        old_records = ProfileRecord.objects.order_by(
+            "-created", "-id"
+        )[settings.PROFILER["MAX_RECORDS"]:]
+        for record in old_records:
+            if os.path.exists(record.stats_path):
+                os.remove(record.stats_path)
+            record.delete()
@@ -0,0 +1,205 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import connections
+
+from .middleware import get_view_name
+
+# Upper bounds of the buckets of the query time in seconds,
+# from 0.1 ms doubling up to ~100 s; the last bucket is unbounded.
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+COMMENTS_RE = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+STRINGS_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBERS_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+PARAMS_RE = re.compile(r"%s|\?")
+LISTS_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+VALUES_RE = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.I)
+SPACES_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """
+    Normalizes the SQL statement: literals and parameters
+    are replaced by '?', lists of values by '(...)',
+    so that all executions of one query have the same fingerprint.
+
+    Example:
+        SELECT ... WHERE "id" IN (%s, %s, %s) AND "name" = 'x'
+        -> SELECT ... WHERE "id" IN (...) AND "name" = ?
+
+    """
+    sql = COMMENTS_RE.sub(" ", sql)
+    sql = STRINGS_RE.sub("?", sql)
+    sql = NUMBERS_RE.sub("?", sql)
+    sql = PARAMS_RE.sub("?", sql)
+    sql = LISTS_RE.sub("(...)", sql)
+    sql = VALUES_RE.sub(r"\1", sql)
+    return SPACES_RE.sub(" ", sql).strip()
+
+
+def percentile(buckets, fraction):
+    """
+    Returns the upper bound of the bucket containing the percentile.
+    """
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    rank = fraction * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= rank:
+            return BUCKETS[min(index, len(BUCKETS) - 1)]
+    return BUCKETS[-1]
+
+
+class QueryStats(object):
+    """
+    Aggregates the count, the total time and the histogram of times
+    per query fingerprint and view in this process, and periodically
+    appends them as JSON lines to a rotating file of the process.
+    """
+
+    def __init__(self, directory, flush_interval, max_bytes, backup_count):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.data = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.logger = None
+
+    def add(self, sql, view, duration):
+        key = (fingerprint(sql), view)
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                item = self.data[key] = [0, 0.0, [0] * (len(BUCKETS) + 1)]
+            item[0] += 1
+            item[1] += duration
+            item[2][bisect.bisect_left(BUCKETS, duration)] += 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            data, self.data = self.data, {}
+            self.last_flush = time.monotonic()
+        if not data:
+            return
+        logger = self.get_logger()
+        timestamp = time.time()
+        for (sql, view), (count, total, buckets) in data.items():
+            logger.info(json.dumps({
+                "ts": timestamp,
+                "fingerprint": sql,
+                "view": view,
+                "count": count,
+                "total": total,
+                "buckets": buckets,
+            }))
+
+    def get_logger(self):
+        if self.logger is None:
+            os.makedirs(self.directory, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(self.directory, f"queries-{os.getpid()}.jsonl"),
+                maxBytes=self.max_bytes,
+                backupCount=self.backup_count
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger(f"{__name__}.{os.getpid()}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            self.logger = logger
+        return self.logger
+
+
+def read_stats(directory):
+    """
+    Reads and merges the flushed statistics of all processes.
+
+    Returns:
+        Dictionary (fingerprint, view) -> [count, total, buckets].
+
+    """
+    merged = {}
+    if not os.path.isdir(directory):
+        return merged
+    for name in os.listdir(directory):
+        if not name.startswith("queries-"):
+            continue
+        with open(os.path.join(directory, name)) as file:
+            for line in file:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                key = (row["fingerprint"], row["view"])
+                item = merged.setdefault(
+                    key, [0, 0.0, [0] * (len(BUCKETS) + 1)]
+                )
+                item[0] += row["count"]
+                item[1] += row["total"]
+                for index, count in enumerate(row["buckets"]):
+                    item[2][index] += count
+    return merged
+
+
+query_stats = QueryStats(
+    directory=settings.QUERY_STATS["DIR"],
+    flush_interval=settings.QUERY_STATS["FLUSH_INTERVAL"],
+    max_bytes=settings.QUERY_STATS["MAX_BYTES"],
+    backup_count=settings.QUERY_STATS["BACKUP_COUNT"],
+)
+atexit.register(query_stats.flush)
+
+
+class QueryStatsMiddleware(object):
+    """
+    Feeds the time of every SQL statement of the request
+    to the query statistics with the view that executed it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.querystats_view = "unresolved"
+
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                query_stats.add(
+                    sql, request.querystats_view,
+                    time.perf_counter() - start
+                )
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(wrapper))
+                return self.get_response(request)
+        finally:
+            query_stats.maybe_flush()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.querystats_view = get_view_name(view_func, request.method)
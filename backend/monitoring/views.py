@@ -0,0 +1,13 @@
+from django.http import HttpResponse
+
+from .metrics import render_metrics
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint. It is not proxied by nginx
+    and is only reachable inside the docker network.
+
+    """
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
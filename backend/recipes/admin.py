@@ -1,6 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin.decorators import register
+from django.db.models import Count, OuterRef, PositiveIntegerField, Subquery
+from django.db.models.functions import Coalesce
 
+from foodgram.db import EstimatedCountPaginator
+
+from .deletion import (count_deleted_rows, deletion_perms_needed,
+                       deletion_summary, delete_recipes, schedule_deletion)
 from .models import (ProductCategory, Ingredient, RecipeIngredient,
                      Recipe, Tag)
 
@@ -54,6 +60,7 @@ class RecipeIngredientsInLines(admin.TabularInline):
 
     """
     model = RecipeIngredient
+    autocomplete_fields = ("ingredients",)
 
 
 @register(Recipe)
@@ -63,12 +70,17 @@ class RecipeAdmin(admin.ModelAdmin):
     of the Recipe model in the Django admin panel.
 
     """
-    list_display = ("name", "cooking_time", "is_visible", "created", "sorting",)
+    list_display = ("name", "author", "cooking_time", "favorites_count",
+                    "ingredients_count", "is_visible", "created", "sorting",)
     list_editable = ("is_visible", "sorting",)
     list_filter = ("tags",)
+    list_select_related = ("author",)
     search_fields = ("name",)
     readonly_fields = ("created",)
+    autocomplete_fields = ("author", "tags",)
     save_on_top = True
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
 
     fieldsets = (
         ("page params",
@@ -81,6 +93,47 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     inlines = (RecipeIngredientsInLines,)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            ingredients_count=Coalesce(Subquery(
+                RecipeIngredient.objects.filter(
+                    recipe_id=OuterRef("pk")
+                ).order_by().values("recipe_id").annotate(
+                    count=Count("id")
+                ).values("count"),
+                output_field=PositiveIntegerField()
+            ), 0)
+        )
+
+    @admin.display(description="ingredients", ordering="ingredients_count")
+    def ingredients_count(self, obj):
+        return obj.ingredients_count
+
+    def get_deleted_objects(self, objs, request):
+        """
+        Shows the numbers of the related rows on the confirmation page
+        instead of collecting every ingredient, favorite and shopping
+        list entry, and the ones the staff user may not delete.
+        """
+        objs = list(objs)
+        counts = count_deleted_rows(recipe_ids=[obj.pk for obj in objs])
+        perms_needed = deletion_perms_needed(request, self.admin_site, counts)
+        return ([str(obj) for obj in objs], deletion_summary(counts),
+                perms_needed, [])
+
+    def delete_model(self, request, obj):
+        delete_recipes([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        schedule_deletion(recipe_ids=list(
+            queryset.values_list("id", flat=True)
+        ))
+        self.message_user(
+            request,
+            "The recipes will be deleted by 'process_deletions'.",
+            messages.INFO
+        )
+
 
 @register(Tag)
 class TagAdmin(admin.ModelAdmin):
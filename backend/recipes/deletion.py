@@ -0,0 +1,328 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_permission_codename
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from foodgram.cache import cache, model_namespace, user_namespace
+
+from .models import (FavoriteRecipe, Recipe, RecipeIngredient,
+                     RecipeTombstone, ScheduledDeletion, ShoppingList,
+                     Subscription, User, refresh_favorites_count)
+from .ranking import record_removals
+
+DELETE_CHUNK_SIZE = 1000
+TOMBSTONE_RETENTION = timedelta(days=settings.CHANGES_RETENTION_DAYS)
+
+
+def raw_delete(queryset) -> int:
+    """
+    Deletes the rows of the queryset with one DELETE statement,
+    without loading them into Python. The signals and the cascades
+    of the model are skipped, so the callers delete the dependent
+    rows first and do the work of the signals themselves.
+
+    QuerySet._raw_delete() is private to Django: recipes/tests/
+    test_deletion.py checks it after the upgrades.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def id_chunks(queryset, chunk_size):
+    """
+    Yields the ids of the queryset in chunks in the order of the id.
+    The next chunk starts after the last id of the previous one,
+    so the rows of the chunk may be deleted before the next one is read.
+    """
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by(
+            "id"
+        ).values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def bump_user_namespaces(user_ids):
+    for user_id in set(user_ids):
+        cache.bump(user_namespace(user_id))
+
+
+def delete_recipe_images(names):
+    storage = Recipe._meta.get_field("image").storage
+    for name in names:
+        if name:
+            storage.delete(name)
+
+
+def delete_recipe_chunk(recipe_ids) -> int:
+    """
+    Deletes the recipes with their ingredients, tags, favorites and
+    shopping list entries in one short transaction and writes their
+    tombstones. After the commit the caches of the recipes and of the
+    users who had them in favorites or in the shopping list are
+    invalidated and the images are removed from the storage.
+
+    Returns:
+        count (int): Number of the deleted recipes.
+
+    """
+    with transaction.atomic():
+        images = dict(Recipe.objects.filter(
+            id__in=recipe_ids
+        ).select_for_update().values_list("id", "image"))
+        if not images:
+            return 0
+        recipe_ids = list(images)
+        user_ids = set()
+        for model in (FavoriteRecipe, ShoppingList):
+            links = model.objects.filter(recipe_id__in=recipe_ids)
+            user_ids.update(links.values_list("user_id", flat=True))
+            raw_delete(links)
+        raw_delete(RecipeIngredient.objects.filter(recipe_id__in=recipe_ids))
+        raw_delete(Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ))
+        raw_delete(Recipe.objects.filter(id__in=recipe_ids))
+        RecipeTombstone.objects.bulk_create([
+            RecipeTombstone(recipe_id=recipe_id) for recipe_id in recipe_ids
+        ])
+
+        def after_commit():
+            cache.bump(model_namespace(Recipe))
+            bump_user_namespaces(user_ids)
+            delete_recipe_images(images.values())
+
+        transaction.on_commit(after_commit)
+    return len(recipe_ids)
+
+
+def delete_recipes(recipe_ids, chunk_size=DELETE_CHUNK_SIZE) -> int:
+    """
+    Deletes the recipes in chunks of 'chunk_size' (see
+    'delete_recipe_chunk'), so neither the memory nor the locks
+    grow with the number of the recipes.
+
+    Returns:
+        count (int): Number of the deleted recipes.
+
+    """
+    recipe_ids = list(recipe_ids)
+    return sum(
+        delete_recipe_chunk(recipe_ids[start:start + chunk_size])
+        for start in range(0, len(recipe_ids), chunk_size)
+    )
+
+
+def delete_user(user_id, chunk_size=DELETE_CHUNK_SIZE) -> dict:
+    """
+    Deletes the user with the recipes, favorites, shopping list and
+    subscriptions in chunks of 'chunk_size' rows, each chunk in its
+    own transaction, keeping Recipe.favorites_count of the other
+    recipes and the caches of the subscribers up to date. The user
+    row itself is deleted by the ORM, so the few remaining relations
+    (tokens, admin log) are deleted with their signals.
+
+    A failed purge can be repeated: the deleted chunks stay deleted.
+
+    Returns:
+        counts (dict): Number of the deleted rows of every kind.
+
+    """
+    counts = dict.fromkeys(
+        ("recipes", "favorites", "shopping_list", "subscriptions", "users"),
+        0
+    )
+    for recipe_ids in id_chunks(
+        Recipe.objects.filter(author_id=user_id), chunk_size
+    ):
+        counts["recipes"] += delete_recipe_chunk(recipe_ids)
+
+    for ids in id_chunks(
+        FavoriteRecipe.objects.filter(user_id=user_id), chunk_size
+    ):
+        with transaction.atomic():
+            favorites = FavoriteRecipe.objects.filter(id__in=ids)
+            recipe_ids = list(favorites.values_list("recipe_id", flat=True))
+            record_removals(favorites)
+            counts["favorites"] += raw_delete(favorites)
+            refresh_favorites_count(recipe_ids)
+
+    for ids in id_chunks(
+        ShoppingList.objects.filter(user_id=user_id), chunk_size
+    ):
+        links = ShoppingList.objects.filter(id__in=ids)
+        record_removals(links)
+        counts["shopping_list"] += raw_delete(links)
+
+    for ids in id_chunks(Subscription.objects.filter(
+        Q(user_id=user_id) | Q(author_id=user_id)
+    ), chunk_size):
+        with transaction.atomic():
+            subscriptions = Subscription.objects.filter(id__in=ids)
+            subscriber_ids = set(subscriptions.values_list(
+                "user_id", flat=True
+            ))
+            counts["subscriptions"] += raw_delete(subscriptions)
+            transaction.on_commit(
+                lambda user_ids=subscriber_ids: bump_user_namespaces(user_ids)
+            )
+
+    with transaction.atomic():
+        _, deleted = User.objects.filter(id=user_id).delete()
+        counts["users"] += deleted.get(User._meta.label, 0)
+        transaction.on_commit(lambda: bump_user_namespaces([user_id]))
+    return counts
+
+
+def delete_users(user_ids, chunk_size=DELETE_CHUNK_SIZE) -> dict:
+    """
+    Deletes the users one by one (see 'delete_user').
+
+    Returns:
+        counts (dict): Number of the deleted rows of every kind.
+
+    """
+    total = {}
+    for user_id in user_ids:
+        for name, count in delete_user(user_id, chunk_size).items():
+            total[name] = total.get(name, 0) + count
+    return total
+
+
+def schedule_deletion(user_ids=(), recipe_ids=()):
+    """
+    Schedules the deletion of the users and the recipes by
+    'process_deletions', so the request doesn't wait for the chunks.
+    The users are deactivated at once, which revokes their tokens.
+    """
+    ScheduledDeletion.objects.bulk_create([
+        ScheduledDeletion(kind=kind, object_id=object_id)
+        for kind, ids in ((ScheduledDeletion.USER, user_ids),
+                          (ScheduledDeletion.RECIPE, recipe_ids))
+        for object_id in ids
+    ], ignore_conflicts=True)
+    for user in User.objects.filter(id__in=user_ids, is_active=True):
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+
+
+def tombstone_cutoff():
+    """
+    Returns the time before which the tombstones are removed:
+    the changes feed refuses the tokens older than that.
+    """
+    return timezone.now() - TOMBSTONE_RETENTION
+
+
+def prune_tombstones(chunk_size=DELETE_CHUNK_SIZE) -> int:
+    """
+    Removes the tombstones older than the retention
+    (see 'tombstone_cutoff') in chunks of 'chunk_size' rows.
+
+    Returns:
+        count (int): Number of the removed tombstones.
+
+    """
+    count = 0
+    for ids in id_chunks(RecipeTombstone.objects.filter(
+        deleted__lt=tombstone_cutoff()
+    ), chunk_size):
+        count += raw_delete(RecipeTombstone.objects.filter(id__in=ids))
+    return count
+
+
+def process_deletions(chunk_size=DELETE_CHUNK_SIZE) -> dict:
+    """
+    Deletes the scheduled users and recipes (see 'schedule_deletion')
+    in chunks of 'chunk_size' rows. The entry is removed after its
+    object is deleted, so an interrupted run is finished by the next one.
+    The expired tombstones are removed as well (see 'prune_tombstones').
+
+    Returns:
+        counts (dict): Number of the deleted rows of every kind.
+
+    """
+    total = {}
+    for ids in id_chunks(ScheduledDeletion.objects.all(), chunk_size):
+        entries = ScheduledDeletion.objects.filter(id__in=ids)
+        recipe_ids = list(entries.filter(
+            kind=ScheduledDeletion.RECIPE
+        ).values_list("object_id", flat=True))
+        counts = {"recipes": delete_recipes(recipe_ids, chunk_size)}
+        for user_id in entries.filter(
+            kind=ScheduledDeletion.USER
+        ).values_list("object_id", flat=True):
+            for name, count in delete_user(user_id, chunk_size).items():
+                counts[name] = counts.get(name, 0) + count
+        entries.delete()
+        for name, count in counts.items():
+            total[name] = total.get(name, 0) + count
+    total["tombstones"] = prune_tombstones(chunk_size)
+    return total
+
+
+def count_deleted_rows(user_ids=(), recipe_ids=()) -> dict:
+    """
+    Returns the numbers of the rows deleted together with the users
+    and the recipes by model, counted in the database instead of
+    collecting every row.
+    """
+    recipes = Recipe.objects.filter(
+        Q(author_id__in=user_ids) | Q(id__in=recipe_ids)
+    )
+    users = Q(user_id__in=user_ids)
+    counts = {
+        User: len(user_ids),
+        Recipe: recipes.count(),
+        RecipeIngredient: RecipeIngredient.objects.filter(
+            recipe__in=recipes
+        ).count(),
+        FavoriteRecipe: FavoriteRecipe.objects.filter(
+            users | Q(recipe__in=recipes)
+        ).count(),
+        ShoppingList: ShoppingList.objects.filter(
+            users | Q(recipe__in=recipes)
+        ).count(),
+        Subscription: Subscription.objects.filter(
+            users | Q(author_id__in=user_ids)
+        ).count(),
+    }
+    return {model: count for model, count in counts.items() if count}
+
+
+def deletion_summary(counts) -> dict:
+    """
+    Returns the numbers of 'count_deleted_rows' by the plural names
+    of the models (for the confirmation page of the admin).
+    """
+    return {model._meta.verbose_name_plural: count
+            for model, count in counts.items()}
+
+
+def deletion_perms_needed(request, admin_site, counts) -> set:
+    """
+    Returns the names of the deleted models (see 'count_deleted_rows')
+    the staff user may not delete, as the admin collector does: by the
+    model admin when the model is registered, by the delete permission
+    otherwise. The ingredients of a recipe are deleted with it.
+    """
+    perms_needed = set()
+    for model in counts:
+        if model is RecipeIngredient:
+            continue
+        model_admin = admin_site._registry.get(model)
+        if model_admin is not None:
+            allowed = model_admin.has_delete_permission(request)
+        else:
+            opts = model._meta
+            allowed = request.user.has_perm(
+                f"{opts.app_label}.{get_permission_codename('delete', opts)}"
+            )
+        if not allowed:
+            perms_needed.add(model._meta.verbose_name)
+    return perms_needed
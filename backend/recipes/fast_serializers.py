@@ -0,0 +1,171 @@
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from rest_framework import serializers
+
+from .models import RecipeIngredient, Subscription, Tag, User
+
+INGREDIENT_ORDERING = ("id",)
+TAG_ORDERING = ("sorting", "id")
+
+
+def column_getter(field):
+    """
+    Returns the function that reads the value of the serializer field
+    from a row of QuerySet.values() and converts it the same way
+    as the field does for a model instance.
+
+    Args:
+        field: Bound field of a ModelSerializer that maps to a column
+            (dotted sources like 'ingredients.name' are supported).
+
+    Returns:
+        (lookup, getter): Lookup for values() and the getter of the row.
+
+    """
+    if isinstance(field, (serializers.BaseSerializer,
+                          serializers.SerializerMethodField)):
+        raise ImproperlyConfigured(
+            f"Field '{field.field_name}' is not a column, "
+            f"pass a getter for it."
+        )
+    lookup = field.source.replace(".", "__")
+    convert = field.to_representation
+    if isinstance(field, serializers.FileField):
+        model_field = field.parent.Meta.model._meta.get_field(field.source)
+        to_representation = field.to_representation
+
+        def convert(value):
+            return to_representation(FieldFile(None, model_field, value))
+
+    def get(row):
+        value = row[lookup]
+        return None if value is None else convert(value)
+
+    return lookup, get
+
+
+class ValuesSerializer(object):
+    """
+    Read-only counterpart of a ModelSerializer for the rows of
+    QuerySet.values(): builds the same dicts in the same key order
+    without model instances and without resolving the fields per row.
+
+    The fields come from the bound serializer, so the sparse fieldset
+    of the request is respected. Nested serializers and method fields
+    need getters passed in 'getters'.
+
+    """
+    def __init__(self, serializer, getters=None):
+        getters = getters or {}
+        self.columns = []
+        self.getters = []
+        for field in serializer._readable_fields:
+            if field.field_name in getters:
+                get = getters[field.field_name]
+            else:
+                lookup, get = column_getter(field)
+                self.columns.append(lookup)
+            self.getters.append((field.field_name, get))
+
+    def to_representation(self, row) -> dict:
+        return {name: get(row) for name, get in self.getters}
+
+    def serialize(self, rows) -> list:
+        getters = self.getters
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+def recipe_columns(serializer, queryset) -> list:
+    """
+    Returns the columns of the recipe rows needed by 'serialize_recipes'.
+    """
+    columns = ["id", "author_id"]
+    columns += ValuesSerializer(
+        serializer, getters=recipe_getters(serializer, {})
+    ).columns
+    columns += [name for name in ("is_favorited", "is_in_shopping_cart")
+                if name in queryset.query.annotations]
+    return list(dict.fromkeys(columns))
+
+
+def recipe_getters(serializer, related) -> dict:
+    getters = {
+        "author": lambda row: related["authors"][row["author_id"]],
+        "tags": lambda row: related["tags"][row["id"]],
+        "ingredients": lambda row: related["ingredients"][row["id"]],
+        "is_favorited": lambda row: row.get("is_favorited", False),
+        "is_in_shopping_cart": (
+            lambda row: row.get("is_in_shopping_cart", False)
+        ),
+    }
+    return {name: get for name, get in getters.items()
+            if name in serializer.fields}
+
+
+def serialize_recipes(serializer, rows, request) -> list:
+    """
+    Builds the same data as RecipeSerializer(many=True) for the rows
+    of the recipe queryset returned by 'recipe_columns'.
+    Authors, tags and ingredients of all rows are read with
+    one query each.
+
+    Args:
+        serializer: RecipeSerializer bound to the request.
+        rows: Recipe rows from QuerySet.values().
+        request: Current request.
+
+    Returns:
+        data (list): List of the recipe dicts.
+
+    """
+    fields = serializer.fields
+    recipe_ids = [row["id"] for row in rows]
+    related = {}
+
+    if "author" in fields:
+        subscribed = set()
+        user_fields = fields["author"].fields
+        if "is_subscribed" in user_fields and request.user.is_authenticated:
+            subscribed = set(Subscription.objects.filter(
+                user=request.user
+            ).values_list("author_id", flat=True))
+        authors = ValuesSerializer(fields["author"], getters={
+            "is_subscribed": lambda row: row["id"] in subscribed,
+        })
+        related["authors"] = {
+            row["id"]: authors.to_representation(row)
+            for row in User.objects.filter(
+                id__in={row["author_id"] for row in rows}
+            ).values(*dict.fromkeys(["id", *authors.columns]))
+        }
+
+    if "tags" in fields:
+        tags = ValuesSerializer(fields["tags"].child)
+        related["tags"] = defaultdict(list)
+        for row in Tag.objects.filter(
+            recipes__in=recipe_ids
+        ).order_by(*TAG_ORDERING).values(
+            *tags.columns, recipe_id=F("recipes__id")
+        ):
+            related["tags"][row["recipe_id"]].append(
+                tags.to_representation(row)
+            )
+
+    if "ingredients" in fields:
+        ingredients = ValuesSerializer(fields["ingredients"].child)
+        related["ingredients"] = defaultdict(list)
+        for row in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by(*INGREDIENT_ORDERING).values(
+            "recipe_id", *ingredients.columns
+        ):
+            related["ingredients"][row["recipe_id"]].append(
+                ingredients.to_representation(row)
+            )
+
+    return ValuesSerializer(
+        serializer, getters=recipe_getters(serializer, related)
+    ).serialize(rows)
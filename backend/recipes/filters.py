@@ -1,7 +1,21 @@
 import django_filters as f
-from django.db.models import OuterRef, Exists
+from django_filters.utils import translate_validation
+from django.db.models import CharField, Count, Exists, F, OuterRef, Value
 
 from .models import Ingredient, Recipe, User, FavoriteRecipe, ShoppingList
+from .serializers import is_field_selected
+
+
+# orderings of the recipe list, each one is backed by an index of Recipe
+RECIPE_ORDERINGS = {
+    'newest': ('-created', '-id'),
+    'fastest': ('cooking_time', 'id'),
+    'favorited': ('-favorites_count', '-id'),
+    'popular': ('-popularity', '-id'),
+}
+DEFAULT_RECIPE_ORDERING = 'newest'
+# the authors facet lists only the authors with the most recipes
+FACET_AUTHORS_LIMIT = 20
 
 
 class IngredientFilter(f.FilterSet):
@@ -17,7 +31,14 @@ class IngredientFilter(f.FilterSet):
 
 class RecipeFilter(f.FilterSet):
     """
-    Custom filter for Recipe model filtered by name and author fields.
+    Custom filter for Recipe model filtered by tags, author
+    and cooking time, with the orderings of RECIPE_ORDERINGS.
+
+    The cooking time range and an ordering by another field can't
+    use one index: the planner either filters the rows of the ordering
+    index or sorts the rows of the range read from the cooking time
+    index, so a wide range with such an ordering costs a sort of up
+    to the whole table.
     """
     tags = f.AllValuesFilter(
         field_name="tags__slug"
@@ -25,31 +46,147 @@ class RecipeFilter(f.FilterSet):
     author = f.ModelChoiceFilter(
         queryset=User.objects.all()
     )
+    cooking_time_min = f.NumberFilter(
+        field_name="cooking_time", lookup_expr="gte"
+    )
+    cooking_time_max = f.NumberFilter(
+        field_name="cooking_time", lookup_expr="lte"
+    )
+    ordering = f.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method="order_recipes"
+    )
 
     class Meta:
         model = Recipe
-        fields = ["tags", "author"]
+        fields = ["tags", "author", "cooking_time_min",
+                  "cooking_time_max", "ordering"]
+
+    @staticmethod
+    def order_recipes(queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
 
     @staticmethod
     def filter_recipe_queryset(request):
+        """
+        Returns the recipes for the request. The per-user flags
+        are annotated only when they are filtered by or present
+        in the response (see 'fields', 'omit' and 'omit_user_state').
+        """
         user = request.user
+        queryset = Recipe.objects.order_by(
+            *RECIPE_ORDERINGS[DEFAULT_RECIPE_ORDERING]
+        )
 
         if user.is_anonymous:
-            return Recipe.objects.all().order_by("-created")
-
-        queryset = Recipe.objects.annotate(
-            is_favorited=Exists(FavoriteRecipe.objects.filter(
-                user=user, recipe_id=OuterRef('pk')
-            )),
-            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
-                user=user, recipe_id=OuterRef('pk')
-            ))
-        ).order_by('-created')
-
-        if request.GET.get('is_favorited'):
-            return queryset.filter(
-                is_favorited=True).order_by("-created")
-        elif request.GET.get('is_in_shopping_cart'):
-            return queryset.filter(
-                is_in_shopping_cart=True).order_by("-created")
+            return queryset
+
+        is_favorited = request.GET.get('is_favorited')
+        is_in_shopping_cart = request.GET.get('is_in_shopping_cart')
+
+        if is_favorited or is_field_selected(request, 'is_favorited'):
+            queryset = queryset.annotate(
+                is_favorited=Exists(FavoriteRecipe.objects.filter(
+                    user=user, recipe_id=OuterRef('pk')
+                ))
+            )
+        if (is_in_shopping_cart
+                or is_field_selected(request, 'is_in_shopping_cart')):
+            queryset = queryset.annotate(
+                is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                    user=user, recipe_id=OuterRef('pk')
+                ))
+            )
+
+        if is_favorited:
+            return queryset.filter(is_favorited=True)
+        elif is_in_shopping_cart:
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def facet_queryset(self, exclude=None):
+        """
+        Returns the recipes matching all filters of the bound
+        filterset except 'exclude', so the counts of a facet show
+        how many recipes every value of that facet would give.
+        """
+        params = self.data
+        queryset = self.queryset
+        user = self.request.user
+        if user.is_authenticated:
+            if params.get('is_favorited') and exclude != 'is_favorited':
+                queryset = queryset.filter(favorite_recipes__user=user)
+            if (params.get('is_in_shopping_cart')
+                    and exclude != 'is_in_shopping_cart'):
+                queryset = queryset.filter(shopping_list_recipes__user=user)
+        for name, value in self.form.cleaned_data.items():
+            if name != exclude:
+                queryset = self.filters[name].filter(queryset, value)
+        return queryset
+
+    @staticmethod
+    def count_facets(request) -> dict:
+        """
+        Counts the recipes per tag, in the favorites and in the
+        shopping list of the user and in total, for the filters
+        of the request, with one UNION ALL query, and per author
+        for the FACET_AUTHORS_LIMIT authors with the most recipes.
+
+        Returns:
+            counts (dict): {facet: {key: count}}, the key is the id
+            of the tag or author, and 0 for the other facets.
+
+        """
+        user = request.user
+        filterset = RecipeFilter(
+            request.GET, queryset=Recipe.objects.all(), request=request
+        )
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+
+        def recipe_ids(exclude=None):
+            return filterset.facet_queryset(exclude).values('id')
+
+        def grouped(queryset, facet, key):
+            return queryset.annotate(
+                facet=Value(facet, output_field=CharField()),
+                key=key
+            ).values('facet', 'key').annotate(
+                count=Count('id')
+            ).order_by()
+
+        queries = [
+            grouped(Recipe.objects.filter(id__in=recipe_ids()),
+                    'total', Value(0)),
+            grouped(Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids('tags')
+            ), 'tags', F('tag_id')),
+        ]
+        if user.is_authenticated:
+            queries += [
+                grouped(FavoriteRecipe.objects.filter(
+                    user=user, recipe_id__in=recipe_ids('is_favorited')
+                ), 'is_favorited', Value(0)),
+                grouped(ShoppingList.objects.filter(
+                    user=user,
+                    recipe_id__in=recipe_ids('is_in_shopping_cart')
+                ), 'is_in_shopping_cart', Value(0)),
+            ]
+
+        counts = {
+            'total': {0: 0},
+            'tags': {},
+            'author': {},
+            'is_favorited': {0: 0},
+            'is_in_shopping_cart': {0: 0},
+        }
+        for row in queries[0].union(*queries[1:], all=True):
+            counts[row['facet']][row['key']] = row['count']
+        # the top of the authors can't be limited inside UNION ALL
+        # on every database, so it is a query of its own
+        for row in grouped(
+            Recipe.objects.filter(id__in=recipe_ids('author')),
+            'author', F('author_id')
+        ).order_by('-count', 'key')[:FACET_AUTHORS_LIMIT]:
+            counts['author'][row['key']] = row['count']
+        return counts
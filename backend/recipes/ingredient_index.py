@@ -0,0 +1,364 @@
+import json
+import os
+import shutil
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from scipy import sparse
+
+from foodgram.db import settled_before
+from foodgram.utils import LRUCache
+
+from .models import Recipe, RecipeIngredient, RecipeTombstone
+
+INDEX_SETTINGS = {
+    "DIR": os.path.join(settings.RUNTIME_DIR, "ingredient_index"),
+    "CHECK_INTERVAL": 5,
+    "KEEP_VERSIONS": 2,
+    "SETTLE_SECONDS": 60,
+    "CHUNK_SIZE": 10000,
+}
+INDEX_SETTINGS.update(getattr(settings, "INGREDIENT_INDEX", {}))
+
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+# arrays of one version of the index, saved as <name>.npy
+ARRAYS = (
+    # sorted ids of the indexed recipes (the rows of the matrix)
+    "recipe_ids",
+    # sorted ids of the used ingredients (the columns of the matrix)
+    "ingredient_ids",
+    # CSR matrix recipe x ingredient: columns of the row i
+    # are indices[indptr[i]:indptr[i + 1]]
+    "indptr",
+    "indices",
+    # the same matrix in CSC, i.e. the inverted index: rows (recipes)
+    # of the column j are postings[postings_indptr[j]:postings_indptr[j + 1]]
+    "postings_indptr",
+    "postings",
+    # number of the ingredients of every row
+    "sizes",
+)
+
+
+class IndexUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = ("The ingredient index is not built yet, "
+                      "please try again later.")
+    default_code = "index_unavailable"
+
+
+class IngredientIndex(object):
+    """
+    Read-only binary matrix recipe x ingredient of one version of the
+    index. The arrays are memory-mapped, so the workers of the server
+    share the pages of the files instead of keeping their own copies.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+        self.path = path
+        self.version = meta["version"]
+        self.built_at = parse_datetime(meta["built_at"])
+        for name in ARRAYS:
+            setattr(self, name, np.load(
+                os.path.join(path, f"{name}.npy"), mmap_mode="r"
+            ))
+
+    @property
+    def size(self) -> int:
+        return len(self.recipe_ids)
+
+    def find(self, keys, values) -> np.ndarray:
+        """
+        Returns the positions of the values in the sorted array 'keys'
+        (the rows of recipe ids or the columns of ingredient ids),
+        skipping the values that are not in the index.
+        """
+        values = np.asarray(values, dtype=np.int64)
+        positions = np.searchsorted(keys, values)
+        positions = positions[positions < len(keys)]
+        found = keys[positions] == values[:len(positions)]
+        return positions[found]
+
+    def rows(self, recipe_ids) -> np.ndarray:
+        return self.find(self.recipe_ids, np.unique(recipe_ids))
+
+    def columns(self, ingredient_ids) -> np.ndarray:
+        return self.find(self.ingredient_ids, np.unique(ingredient_ids))
+
+    def ingredients_of(self, row) -> np.ndarray:
+        return self.ingredient_ids[
+            self.indices[self.indptr[row]:self.indptr[row + 1]]
+        ]
+
+    def overlap(self, ingredient_ids) -> np.ndarray:
+        """
+        Returns the number of the given ingredients in every row,
+        counted over the postings of the ingredients only.
+        """
+        postings = [
+            self.postings[self.postings_indptr[column]:
+                          self.postings_indptr[column + 1]]
+            for column in self.columns(ingredient_ids)
+        ]
+        if not postings:
+            return np.zeros(self.size, dtype=np.int64)
+        return np.bincount(np.concatenate(postings), minlength=self.size)
+
+
+class IndexOverlay(object):
+    """
+    Changes of the recipes after the build of the index: the current
+    ingredients of the recipes created or updated since then and the
+    ids of the deleted recipes. Their rows in the index are stale and
+    are replaced by these sets until the next build.
+    """
+
+    def __init__(self, index):
+        self.changed = {}
+        for recipe_id, ingredient_id in Recipe.objects.filter(
+            updated__gt=index.built_at
+        ).values_list("id", "ingredients_amounts__ingredients_id"):
+            ingredients = self.changed.setdefault(recipe_id, set())
+            if ingredient_id is not None:
+                ingredients.add(ingredient_id)
+        self.deleted = set(RecipeTombstone.objects.filter(
+            deleted__gt=index.built_at
+        ).values_list("recipe_id", flat=True))
+        self.stale_rows = index.rows(list(self.changed.keys() | self.deleted))
+
+
+_state = {"index": None, "checked": 0.0, "current": None}
+_lock = threading.Lock()
+_overlays = LRUCache(max_size=4, ttl=INDEX_SETTINGS["CHECK_INTERVAL"])
+
+
+def read_current(directory) -> str:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def get_index():
+    """
+    Returns the current version of the index of this process,
+    switching to a new version at most every CHECK_INTERVAL seconds
+    after 'build_index' has replaced it.
+
+    Raises:
+        IndexUnavailable: The index was never built.
+
+    """
+    now = time.monotonic()
+    with _lock:
+        if now - _state["checked"] >= INDEX_SETTINGS["CHECK_INTERVAL"]:
+            _state["checked"] = now
+            directory = INDEX_SETTINGS["DIR"]
+            current = read_current(directory)
+            if current is not None and current != _state["current"]:
+                _state["index"] = IngredientIndex(
+                    os.path.join(directory, current)
+                )
+                _state["current"] = current
+        index = _state["index"]
+    if index is None:
+        raise IndexUnavailable()
+    return index
+
+
+def get_overlay(index) -> IndexOverlay:
+    overlay = _overlays.get(index.version)
+    if overlay is None:
+        overlay = IndexOverlay(index)
+        _overlays.set(index.version, overlay)
+    return overlay
+
+
+def top_scores(ids, scores, limit) -> list:
+    """
+    Returns at most 'limit' pairs (id, score) with the highest
+    positive scores, the smaller id first among the equal scores.
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > limit:
+        # all the candidates equal to the last one are kept,
+        # so the ties are broken by the id and not by the partition
+        last = -np.partition(-scores[candidates], limit - 1)[limit - 1]
+        candidates = candidates[scores[candidates] >= last]
+    return sorted(
+        zip(ids[candidates].tolist(), scores[candidates].tolist()),
+        key=lambda item: (-item[1], item[0])
+    )[:limit]
+
+
+def similar_recipes(recipe_id, limit) -> list:
+    """
+    Returns the recipes with the most common ingredients: the cosine
+    similarity of the binary ingredient vectors, i.e. the number of the
+    common ingredients divided by the geometric mean of the numbers
+    of the ingredients of both recipes.
+
+    Only the postings of the ingredients of the recipe are read,
+    the stale rows of the index are replaced by the overlay.
+
+    Args:
+        recipe_id: Id of the recipe.
+        limit: Maximal number of the similar recipes.
+
+    Returns:
+        similar (list): Pairs (recipe id, similarity), the most
+            similar first.
+
+    """
+    index = get_index()
+    overlay = get_overlay(index)
+    if recipe_id in overlay.changed:
+        ingredients = overlay.changed[recipe_id]
+    else:
+        rows = index.rows([recipe_id])
+        ingredients = (set(index.ingredients_of(rows[0]).tolist())
+                       if len(rows) else set())
+    if not ingredients:
+        return []
+
+    scores = index.overlap(list(ingredients)) / np.sqrt(
+        np.maximum(index.sizes, 1) * len(ingredients)
+    )
+    scores[index.rows([recipe_id])] = 0
+    scores[overlay.stale_rows] = 0
+    similar = top_scores(index.recipe_ids, scores, limit)
+
+    for other_id, other_ingredients in overlay.changed.items():
+        common = len(ingredients & other_ingredients)
+        if other_id != recipe_id and common:
+            similar.append((other_id, common / np.sqrt(
+                len(ingredients) * len(other_ingredients)
+            )))
+    similar.sort(key=lambda item: (-item[1], item[0]))
+    return similar[:limit]
+
+
+def match_pantry(index, ingredient_ids, max_missing, overlay=None):
+    """
+    Returns the recipes that have at least one of the ingredients
+    and miss at most 'max_missing' of their own ingredients,
+    the fewest missing first, then the most matched, then by id.
+
+    Args:
+        index: IngredientIndex.
+        ingredient_ids: Ids of the available ingredients.
+        max_missing: Maximal number of the missing ingredients.
+        overlay: IndexOverlay of the index, if any.
+
+    Returns:
+        (ids, missing): Arrays of the recipe ids and of the numbers
+            of their missing ingredients.
+
+    """
+    pantry = set(ingredient_ids)
+    matched = index.overlap(list(pantry))
+    missing = index.sizes - matched
+    found = (matched > 0) & (missing <= max_missing)
+    changed = []
+    if overlay is not None:
+        found[overlay.stale_rows] = False
+        for recipe_id, ingredients in overlay.changed.items():
+            common = len(ingredients & pantry)
+            lacking = len(ingredients) - common
+            if common and lacking <= max_missing:
+                changed.append((recipe_id, common, lacking))
+    changed = np.array(changed, dtype=np.int64).reshape(-1, 3)
+
+    ids = np.concatenate([index.recipe_ids[found], changed[:, 0]])
+    matched = np.concatenate([matched[found], changed[:, 1]])
+    missing = np.concatenate([missing[found], changed[:, 2]])
+    order = np.lexsort((ids, -matched, missing))
+    return ids[order], missing[order]
+
+
+def pantry_recipes(ingredient_ids, max_missing):
+    """
+    Returns 'match_pantry' for the current index with the
+    recipes changed since its build.
+    """
+    index = get_index()
+    return match_pantry(
+        index, ingredient_ids, max_missing, get_overlay(index)
+    )
+
+
+def build_index(directory=None) -> dict:
+    """
+    Builds a new version of the index from RecipeIngredient, saves it
+    next to the previous versions and makes it current. The workers
+    switch to it on their next check, the oldest versions
+    beyond KEEP_VERSIONS are removed.
+
+    The recipes changed during the last SETTLE_SECONDS before the build
+    stay in the overlay (see 'settled_before').
+
+    Returns:
+        meta (dict): Version, build time and size of the index.
+
+    """
+    directory = directory or INDEX_SETTINGS["DIR"]
+    built_at = settled_before(INDEX_SETTINGS["SETTLE_SECONDS"])
+    pairs = np.fromiter(
+        chain.from_iterable(RecipeIngredient.objects.order_by().values_list(
+            "recipe_id", "ingredients_id"
+        ).iterator(chunk_size=INDEX_SETTINGS["CHUNK_SIZE"])),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int8), (rows, columns)),
+        shape=(len(recipe_ids), len(ingredient_ids))
+    )
+    matrix.sum_duplicates()
+    inverted = matrix.tocsc()
+    inverted.sort_indices()
+    arrays = {
+        "recipe_ids": recipe_ids,
+        "ingredient_ids": ingredient_ids,
+        "indptr": matrix.indptr.astype(np.int64),
+        "indices": matrix.indices.astype(np.int32),
+        "postings_indptr": inverted.indptr.astype(np.int64),
+        "postings": inverted.indices.astype(np.int32),
+        "sizes": np.diff(matrix.indptr).astype(np.int32),
+    }
+
+    meta = {
+        "version": built_at.strftime("%Y%m%d%H%M%S%f"),
+        "built_at": built_at.isoformat(),
+        "recipes": len(recipe_ids),
+        "ingredients": len(ingredient_ids),
+        "links": int(matrix.nnz),
+    }
+    path = os.path.join(directory, meta["version"])
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, META_FILE), "w") as file:
+        json.dump(meta, file)
+
+    temporary = os.path.join(directory, f"{CURRENT_FILE}.tmp")
+    with open(temporary, "w") as file:
+        file.write(meta["version"])
+    os.replace(temporary, os.path.join(directory, CURRENT_FILE))
+
+    versions = sorted(name for name in os.listdir(directory)
+                      if os.path.isdir(os.path.join(directory, name)))
+    for name in versions[:-INDEX_SETTINGS["KEEP_VERSIONS"]]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return meta
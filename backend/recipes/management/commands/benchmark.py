@@ -0,0 +1,368 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from foodgram.renderers import MessagePackRenderer, ORJSONRenderer
+from recipes.fast_serializers import (ValuesSerializer, recipe_columns,
+                                      serialize_recipes)
+from recipes.filters import RECIPE_ORDERINGS, RecipeFilter
+from recipes.ingredient_index import IngredientIndex, build_index, match_pantry
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, Tag,
+                            User)
+from recipes.serializers import IngredientSerializer, RecipeSerializer
+from recipes.views import prune_recipe_queryset
+from recipes.throttling import ActionScopedThrottle
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def seeded_recipes(count, ingredients_per_recipe=8):
+    """
+    Creates the recipes with authors, tags and ingredients
+    for the benchmark and removes them afterwards.
+    """
+    try:
+        with transaction.atomic():
+            # bulk_create() doesn't set the ids on every database,
+            # so the objects are read back
+            User.objects.bulk_create([
+                User(email=f"benchmark{i}@example.com",
+                     username=f"benchmark{i}",
+                     first_name="Бенчмарк", last_name=f"Автор {i}")
+                for i in range(10)
+            ])
+            authors = list(User.objects.filter(
+                username__startswith="benchmark"
+            ).order_by("id"))
+            Tag.objects.bulk_create([
+                Tag(name=name, color="#E26C2D", slug=f"benchmark-{i}")
+                for i, (name, _) in enumerate(Tag.MEAL_TIME)
+            ])
+            tags = list(Tag.objects.filter(
+                slug__startswith="benchmark-"
+            ).order_by("id"))
+            Ingredient.objects.bulk_create([
+                Ingredient(name=f"benchmark ингредиент {i}",
+                           measurement_unit="г")
+                for i in range(200)
+            ])
+            ingredients = list(Ingredient.objects.filter(
+                name__startswith="benchmark "
+            ).order_by("id"))
+            Recipe.objects.bulk_create([
+                Recipe(name=f"Рецепт {i}", author=authors[i % len(authors)],
+                       image=f"images/{i}/benchmark.jpg",
+                       text="Нарезать, смешать и запечь. " * 20,
+                       cooking_time=5 + i % 120)
+                for i in range(count)
+            ], batch_size=1000)
+            recipes = list(Recipe.objects.filter(
+                author__in=authors
+            ).order_by("id"))
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe=recipe, tag=tags[i % len(tags)])
+                for i, recipe in enumerate(recipes)
+            ])
+            # in chunks, so that a large seed doesn't hold all the
+            # links in memory at once
+            for start in range(0, len(recipes), 1000):
+                RecipeIngredient.objects.bulk_create([
+                    RecipeIngredient(
+                        recipe=recipe,
+                        ingredients=ingredients[
+                            (i * 7 + j) % len(ingredients)
+                        ],
+                        amount=10 + j
+                    )
+                    for i, recipe in enumerate(
+                        recipes[start:start + 1000], start
+                    )
+                    for j in range(ingredients_per_recipe)
+                ])
+            yield recipes
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def measure(function, iterations):
+    """
+    Returns the mean time of the call in microseconds
+    and the number of database queries of all calls.
+    """
+    function()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        duration = time.perf_counter() - start
+    return duration / iterations * 1e6, len(queries)
+
+
+class ThrottleView(object):
+    action = "favorite"
+    throttle_scopes = {"favorite": "favorite"}
+
+
+def benchmark_throttle(command, options):
+    throttle = ActionScopedThrottle()
+    view = ThrottleView()
+    request = Request(RequestFactory().get("/api/recipes/1/favorite/"))
+    request.user = User(id=10 ** 9, email="benchmark@example.com")
+    throttle.cache.clear()
+
+    def check():
+        throttle.allow_request(request, view)
+
+    mean, queries = measure(check, options["iterations"])
+    command.stdout.write(
+        f"throttle check: {mean:.1f} us per request, "
+        f"{queries} database queries"
+    )
+
+
+def benchmark_renderers(command, options):
+    with seeded_recipes(options["page_size"]) as recipes:
+        request = Request(RequestFactory().get("/api/recipes/"))
+        queryset = Recipe.objects.filter(
+            id__in=[recipe.id for recipe in recipes]
+        ).order_by("-id")
+        data = {
+            "count": len(recipes),
+            "next": None,
+            "previous": None,
+            "results": RecipeSerializer(
+                queryset, many=True, context={"request": request}
+            ).data,
+        }
+
+    iterations = max(options["iterations"] // 100, 10)
+    expected = JSONRenderer().render(data)
+    for renderer in (JSONRenderer(), ORJSONRenderer(), MessagePackRenderer()):
+        content = renderer.render(data)
+        mean, _ = measure(lambda: renderer.render(data), iterations)
+        identical = ""
+        if renderer.media_type == JSONRenderer.media_type:
+            # the floats may be written in another notation
+            if content == expected:
+                identical = ", identical"
+            elif json.loads(content) == json.loads(expected):
+                identical = ", equal"
+            else:
+                identical = ", DIFFERENT"
+        command.stdout.write(
+            f"{type(renderer).__name__}: {mean:.0f} us per page "
+            f"of {len(recipes)} recipes, {len(content)} bytes{identical}"
+        )
+
+
+def benchmark_serializers(command, options):
+    """
+    Compares RecipeSerializer and IngredientSerializer with the
+    values() based fast path on the same rows and checks that
+    both give the same JSON.
+    """
+    iterations = max(options["iterations"] // 1000, 5)
+    renderer = JSONRenderer()
+    with seeded_recipes(options["page_size"]) as recipes:
+        request = Request(RequestFactory().get("/api/recipes/"))
+        request.user = recipes[0].author
+        recipe_ids = [recipe.id for recipe in recipes]
+
+        def recipes_queryset():
+            return RecipeFilter.filter_recipe_queryset(request).filter(
+                id__in=recipe_ids
+            ).order_by("-id")
+
+        def serializer_path():
+            queryset = prune_recipe_queryset(recipes_queryset(), request)
+            return RecipeSerializer(
+                queryset, many=True, context={"request": request}
+            ).data
+
+        def fast_path():
+            serializer = RecipeSerializer(context={"request": request})
+            queryset = recipes_queryset()
+            rows = list(queryset.values(*recipe_columns(serializer, queryset)))
+            return serialize_recipes(serializer, rows, request)
+
+        ingredients = Ingredient.objects.filter(
+            name__startswith="benchmark "
+        )
+
+        def ingredients_serializer_path():
+            return IngredientSerializer(
+                ingredients.all(), many=True, context={"request": request}
+            ).data
+
+        def ingredients_fast_path():
+            serializer = ValuesSerializer(
+                IngredientSerializer(context={"request": request})
+            )
+            return serializer.serialize(
+                ingredients.values(*serializer.columns)
+            )
+
+        for name, paths, count in (
+            ("recipes", (serializer_path, fast_path), len(recipes)),
+            ("ingredients", (ingredients_serializer_path,
+                             ingredients_fast_path), ingredients.count()),
+        ):
+            contents = [renderer.render(path()) for path in paths]
+            identical = "identical" if len(set(contents)) == 1 else "DIFFERENT"
+            for label, path in zip(("serializer", "values"), paths):
+                mean, queries = measure(path, iterations)
+                command.stdout.write(
+                    f"{name} {label}: {count / mean * 1e6:.0f} rows/s, "
+                    f"{queries // iterations} queries per call"
+                )
+            command.stdout.write(f"{name} output: {identical}")
+
+
+# markers of a sort step in the query plans of SQLite and PostgreSQL
+SORT_MARKERS = ("TEMP B-TREE FOR ORDER BY", "Sort Key")
+
+
+def benchmark_orderings(command, options):
+    """
+    Checks with EXPLAIN that every ordering of the recipe list,
+    with and without the cooking time range, reads the page
+    from an index. With the range the planner may also take the
+    cooking time index and sort only the rows of the range,
+    but never the whole table.
+    """
+    filters = [
+        {},
+        {"cooking_time_min": 10, "cooking_time_max": 30},
+    ]
+    index_names = [index.name for index in Recipe._meta.indexes]
+    with seeded_recipes(options["page_size"] * 10):
+        for ordering in RECIPE_ORDERINGS:
+            for params in filters:
+                request = Request(RequestFactory().get(
+                    "/api/recipes/", {"ordering": ordering, **params}
+                ))
+                request.user = AnonymousUser()
+                filterset = RecipeFilter(
+                    request.GET,
+                    queryset=RecipeFilter.filter_recipe_queryset(request),
+                    request=request
+                )
+                queryset = filterset.qs[:options["page_size"]]
+                plan = queryset.explain()
+                indexes = [name for name in index_names if name in plan]
+                if not any(marker in plan for marker in SORT_MARKERS):
+                    result = "no sort"
+                elif indexes:
+                    result = "sorts the rows of the index range"
+                else:
+                    result = "SORTS THE TABLE"
+                command.stdout.write(
+                    f"{request.GET.urlencode()}: "
+                    f"{', '.join(indexes) or 'no index'}, {result}"
+                )
+
+
+def benchmark_pantry(command, options):
+    """
+    Compares the pantry search on the inverted ingredient index
+    with the GROUP BY over RecipeIngredient on the seeded recipes
+    and checks that both find the same recipes in the same order.
+    """
+    iterations = max(options["iterations"] // 1000, 5)
+    with seeded_recipes(options["recipes"]), \
+            tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        meta = build_index(directory)
+        command.stdout.write(
+            f"index build: {time.perf_counter() - start:.2f} s, "
+            f"{meta['recipes']} recipes, {meta['links']} links"
+        )
+        index = IngredientIndex(os.path.join(directory, meta["version"]))
+        pantry = list(Ingredient.objects.filter(
+            name__startswith="benchmark "
+        ).order_by("id").values_list("id", flat=True)[:12])
+        matched = Count("id", filter=Q(ingredients_id__in=pantry))
+
+        for max_missing in (0, 2):
+            def index_path():
+                ids, missing = match_pantry(index, pantry, max_missing)
+                return list(zip(ids.tolist(), missing.tolist()))
+
+            def database_path():
+                return list(RecipeIngredient.objects.values(
+                    "recipe_id"
+                ).annotate(
+                    matched=matched, missing=Count("id") - matched
+                ).filter(
+                    matched__gt=0, missing__lte=max_missing
+                ).order_by(
+                    "missing", "-matched", "recipe_id"
+                ).values_list("recipe_id", "missing"))
+
+            results = index_path()
+            identical = ("identical" if results == database_path()
+                         else "DIFFERENT")
+            for label, path in (("index", index_path),
+                                ("database", database_path)):
+                mean, queries = measure(path, iterations)
+                command.stdout.write(
+                    f"pantry of {len(pantry)} max_missing={max_missing} "
+                    f"{label}: {mean / 1000:.1f} ms per search, "
+                    f"{queries // iterations} queries per search"
+                )
+            command.stdout.write(
+                f"pantry max_missing={max_missing}: {len(results)} "
+                f"recipes, {identical}"
+            )
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of the hot paths of the API"
+
+    targets = {
+        "throttle": benchmark_throttle,
+        "renderers": benchmark_renderers,
+        "serializers": benchmark_serializers,
+        "orderings": benchmark_orderings,
+        "pantry": benchmark_pantry,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "targets", nargs="*",
+            help=f"What to measure: {', '.join(self.targets)} (all by default)."
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=10000,
+            help="Number of the measured calls."
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=100,
+            help="Number of recipes on the seeded page."
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=100000,
+            help="Number of the seeded recipes of the pantry search."
+        )
+
+    def handle(self, *args, **options):
+        targets = options["targets"] or list(self.targets)
+        for target in targets:
+            if target not in self.targets:
+                raise CommandError(f"Unknown benchmark: {target}")
+            self.targets[target](self, options)
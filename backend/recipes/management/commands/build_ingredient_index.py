@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ingredient_index import build_index
+
+
+class Command(BaseCommand):
+    help = ("Build the matrix recipe x ingredient used for the similar "
+            "recipes and make it current (run it periodically)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir", default=None,
+            help="Directory of the index (INGREDIENT_INDEX['DIR'] "
+                 "by default)."
+        )
+
+    def handle(self, *args, **options):
+        meta = build_index(options["dir"])
+        self.stdout.write(
+            f"version {meta['version']}: {meta['recipes']} recipes, "
+            f"{meta['ingredients']} ingredients, {meta['links']} links"
+        )
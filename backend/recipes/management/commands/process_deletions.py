@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.deletion import DELETE_CHUNK_SIZE, process_deletions
+
+
+class Command(BaseCommand):
+    help = ("Delete the users and recipes scheduled for deletion by the API "
+            "and the admin in small chunks, and the expired tombstones of "
+            "the deleted recipes (run it periodically)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=DELETE_CHUNK_SIZE,
+            help="Number of rows deleted in one transaction."
+        )
+
+    def handle(self, *args, **options):
+        counts = process_deletions(options["chunk_size"])
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.deletion import DELETE_CHUNK_SIZE, delete_users
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = ("Delete the users with their recipes, favorites, shopping lists "
+            "and subscriptions in small chunks")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "emails", nargs="+",
+            help="Emails of the deleted users."
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=DELETE_CHUNK_SIZE,
+            help="Number of rows deleted in one transaction."
+        )
+
+    def handle(self, *args, **options):
+        emails = options["emails"]
+        users = dict(User.objects.filter(
+            email__in=emails
+        ).values_list("email", "id"))
+        unknown = [email for email in emails if email not in users]
+        if unknown:
+            raise CommandError(f"Unknown users: {', '.join(unknown)}")
+        counts = delete_users(users.values(), options["chunk_size"])
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ranking import update_popularity
+
+
+class Command(BaseCommand):
+    help = ("Add the favorites and shopping list events since the previous "
+            "run to the popularity of the recipes and subtract the removed "
+            "ones (run it periodically)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Number of events processed in one transaction."
+        )
+
+    def handle(self, *args, **options):
+        counts = update_popularity(options["batch_size"])
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count} events")
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='recipe id')),
+                ('deleted', models.DateTimeField(auto_now_add=True, verbose_name='deleted')),
+            ],
+            options={
+                'verbose_name': 'deleted recipe',
+                'verbose_name_plural': 'deleted recipes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated', 'id'], name='recipe_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipetombstone',
+            index=models.Index(fields=['deleted', 'id'], name='tombstone_deleted_id_idx'),
+        ),
+    ]
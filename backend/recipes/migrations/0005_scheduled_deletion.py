@@ -0,0 +1,30 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'user'), ('recipe', 'recipe')], max_length=10, verbose_name='kind')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='object id')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='scheduled')),
+            ],
+            options={
+                'verbose_name': 'scheduled deletion',
+                'verbose_name_plural': 'scheduled deletions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='scheduleddeletion',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='scheduled_deletion_unique'),
+        ),
+    ]
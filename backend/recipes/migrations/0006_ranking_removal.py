@@ -0,0 +1,26 @@
+# Generated by Django 3.2.7 on 2026-10-19 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_scheduled_deletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingRemoval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100, verbose_name='source')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='recipe id')),
+                ('created', models.DateTimeField(verbose_name='time of the event')),
+            ],
+            options={
+                'verbose_name': 'ranking removal',
+                'verbose_name_plural': 'ranking removals',
+            },
+        ),
+    ]
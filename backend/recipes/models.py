@@ -1,6 +1,8 @@
 import uuid
 
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.urls import reverse
@@ -208,12 +210,38 @@ class Recipe(models.Model):
         verbose_name="sorting",
         default=0
     )
+    # copy of the number of FavoriteRecipe rows, see refresh_favorites_count
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="number of favorites",
+        default=0,
+        editable=False
+    )
+    # logarithm of the time decayed activity, see recipes.ranking
+    popularity = models.FloatField(
+        verbose_name="popularity",
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = "recipe"
         verbose_name_plural = "recipes"
         app_label = "recipes"
         ordering = ("sorting",)
+        indexes = [
+            # keyset paging of the changes feed
+            models.Index(fields=["updated", "id"],
+                         name="recipe_updated_id_idx"),
+            # orderings of the recipe list (see RECIPE_ORDERINGS)
+            models.Index(fields=["created", "id"],
+                         name="recipe_created_id_idx"),
+            models.Index(fields=["cooking_time", "id"],
+                         name="recipe_cooking_time_id_idx"),
+            models.Index(fields=["favorites_count", "id"],
+                         name="recipe_favorites_id_idx"),
+            models.Index(fields=["popularity", "id"],
+                         name="recipe_popularity_id_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -316,11 +344,20 @@ class FavoriteRecipe(models.Model):
         on_delete=models.CASCADE,
         related_name="favorite_recipes"
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="created"
+    )
 
     class Meta:
         verbose_name = "favorite recipe"
         verbose_name_plural = "favorite recipes"
         app_label = "recipes"
+        indexes = [
+            # reading of the new events by the popularity ranking
+            models.Index(fields=["created", "id"],
+                         name="favorite_created_id_idx"),
+        ]
         models.UniqueConstraint(
             fields=["user", "recipe"], name="favorite_recipe_unique"
         )
@@ -329,6 +366,27 @@ class FavoriteRecipe(models.Model):
         return f"Recipe {self.recipe} in favorites list of {self.user}"
 
 
+def refresh_favorites_count(recipe_ids):
+    """
+    Recounts Recipe.favorites_count of the recipes from the
+    favorites table, so concurrent changes can't make it drift.
+
+    Args:
+        recipe_ids: Ids of the recipes.
+
+    """
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        favorites_count=Coalesce(Subquery(
+            FavoriteRecipe.objects.filter(
+                recipe_id=OuterRef("pk")
+            ).order_by().values("recipe_id").annotate(
+                count=Count("id")
+            ).values("count"),
+            output_field=models.PositiveIntegerField()
+        ), 0)
+    )
+
+
 class ShoppingList(models.Model):
     """
     Model for storing recipes in a shopping list,
@@ -353,9 +411,122 @@ class ShoppingList(models.Model):
         verbose_name = "shopping list"
         verbose_name_plural = "shopping list"
         app_label = "recipes"
+        indexes = [
+            # reading of the new events by the popularity ranking
+            models.Index(fields=["created", "id"],
+                         name="shopping_list_created_id_idx"),
+        ]
         models.UniqueConstraint(
             fields=["user", "recipe"], name="shopping_list_unique"
         )
 
     def __str__(self):
         return f"Recipe {self.recipe} in shopping list of {self.user}"
+
+
+class RecipeTombstone(models.Model):
+    """
+    Record of a deleted recipe, so that the clients syncing
+    the changes can remove it from their copy.
+    """
+    recipe_id = models.PositiveBigIntegerField(verbose_name="recipe id")
+    deleted = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="deleted"
+    )
+
+    class Meta:
+        verbose_name = "deleted recipe"
+        verbose_name_plural = "deleted recipes"
+        app_label = "recipes"
+        indexes = [
+            models.Index(fields=["deleted", "id"],
+                         name="tombstone_deleted_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"Recipe {self.recipe_id} deleted at {self.deleted}"
+
+
+class RankingCheckpoint(models.Model):
+    """
+    Position (time and id) of the last event of the source
+    processed by an incremental ranking job.
+    """
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name="name"
+    )
+    created = models.DateTimeField(verbose_name="time of the last event")
+    last_id = models.PositiveBigIntegerField(
+        verbose_name="id of the last event"
+    )
+
+    class Meta:
+        verbose_name = "ranking checkpoint"
+        verbose_name_plural = "ranking checkpoints"
+        app_label = "recipes"
+
+    def __str__(self):
+        return f"{self.name}: {self.created}, {self.last_id}"
+
+
+class RankingRemoval(models.Model):
+    """
+    Removed event (favorite or shopping list entry) which the ranking
+    has already counted, waiting to be subtracted from the popularity
+    of the recipe by the next run.
+    """
+    source = models.CharField(
+        max_length=100,
+        verbose_name="source"
+    )
+    recipe_id = models.PositiveBigIntegerField(verbose_name="recipe id")
+    created = models.DateTimeField(verbose_name="time of the event")
+
+    class Meta:
+        verbose_name = "ranking removal"
+        verbose_name_plural = "ranking removals"
+        app_label = "recipes"
+
+    def __str__(self):
+        return f"{self.source}: recipe {self.recipe_id} at {self.created}"
+
+
+class ScheduledDeletion(models.Model):
+    """
+    User or recipe waiting to be deleted in chunks
+    by 'manage.py process_deletions' outside of the request.
+    """
+    USER = "user"
+    RECIPE = "recipe"
+    KINDS = (
+        (USER, "user"),
+        (RECIPE, "recipe"),
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KINDS,
+        verbose_name="kind"
+    )
+    object_id = models.PositiveBigIntegerField(verbose_name="object id")
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="scheduled"
+    )
+
+    class Meta:
+        verbose_name = "scheduled deletion"
+        verbose_name_plural = "scheduled deletions"
+        app_label = "recipes"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"],
+                name="scheduled_deletion_unique"
+            )
+        ]
+
+    def __str__(self):
+        return (f"{self.get_kind_display()} {self.object_id} "
+                f"scheduled at {self.created}")
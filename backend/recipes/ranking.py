@@ -0,0 +1,218 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils.dateparse import parse_datetime
+
+from foodgram.db import settled_before
+
+from .models import (FavoriteRecipe, RankingCheckpoint, RankingRemoval,
+                     Recipe, ShoppingList)
+
+RANKING_SETTINGS = {
+    "EPOCH": "2021-01-01T00:00:00+00:00",
+    "HALF_LIFE_DAYS": 7,
+    "FAVORITE_WEIGHT": 1.0,
+    "SHOPPING_LIST_WEIGHT": 0.5,
+    "BATCH_SIZE": 5000,
+    "SETTLE_SECONDS": 60,
+}
+RANKING_SETTINGS.update(getattr(settings, "POPULARITY", {}))
+
+EPOCH = parse_datetime(RANKING_SETTINGS["EPOCH"])
+# time constant of the decay in seconds: the weight of an event
+# halves every HALF_LIFE_DAYS
+DECAY_TIME = RANKING_SETTINGS["HALF_LIFE_DAYS"] * 86400 / math.log(2)
+
+# events counted by the ranking: (checkpoint name, model, weight)
+SOURCES = (
+    ("popularity:favorites", FavoriteRecipe,
+     RANKING_SETTINGS["FAVORITE_WEIGHT"]),
+    ("popularity:shopping_list", ShoppingList,
+     RANKING_SETTINGS["SHOPPING_LIST_WEIGHT"]),
+)
+SOURCE_NAMES = {model: name for name, model, _ in SOURCES}
+# relative rounding error of the sums of the stored logarithms
+LOG_ROUNDING = 1e-9
+
+
+def log_add(a, b) -> float:
+    """
+    Returns log(exp(a) + exp(b)) without overflow.
+    """
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def log_sub(a, b) -> float:
+    """
+    Returns log(exp(a) - exp(b)), but not less than 0, the score
+    of a recipe without events. A rest below the rounding of 'a'
+    (when the last events of the recipe are removed) is noise
+    and gives 0 as well.
+    """
+    if b >= a - LOG_ROUNDING:
+        return 0.0
+    return max(a + math.log1p(-math.exp(b - a)), 0.0)
+
+
+def event_score(moment, weight) -> float:
+    """
+    Returns the logarithm of the score of one event.
+
+    The score of the recipe is the sum of weight * exp(-age / DECAY_TIME)
+    over its events. The common factor exp(-now / DECAY_TIME) is dropped,
+    so an event adds weight * exp((moment - EPOCH) / DECAY_TIME)
+    and the stored scores never have to be decayed: the order
+    of the recipes is the same at any moment. The logarithm of the
+    sum is stored to keep the growing values in a float
+    (the default 0 of a recipe without events stands for exp(0),
+    far below the score of any recent event).
+
+    Args:
+        moment: Time of the event.
+        weight: Weight of the kind of the event.
+
+    Returns:
+        score (float): Logarithm of the score of the event.
+
+    """
+    return ((moment - EPOCH).total_seconds() / DECAY_TIME
+            + math.log(weight))
+
+
+def apply_events(scores, removed):
+    """
+    Adds the scores of the new events to Recipe.popularity
+    and subtracts the scores of the removed ones.
+
+    Args:
+        scores (dict): Logarithm of the sum of the new events
+            for every recipe id.
+        removed (dict): Logarithm of the sum of the removed events
+            for every recipe id.
+
+    """
+    recipes = list(Recipe.objects.filter(
+        id__in=[*scores, *removed]
+    ).select_for_update().only("id", "popularity"))
+    for recipe in recipes:
+        if recipe.pk in scores:
+            recipe.popularity = log_add(recipe.popularity, scores[recipe.pk])
+        if recipe.pk in removed:
+            recipe.popularity = log_sub(recipe.popularity, removed[recipe.pk])
+    Recipe.objects.bulk_update(recipes, ["popularity"])
+
+
+def record_removals(queryset):
+    """
+    Records the events of the queryset which the ranking has already
+    counted (those up to the checkpoint of the source), so that
+    'process_source' subtracts them. Called before the rows are
+    deleted, with one query when none of them is counted.
+
+    The subtraction is approximate: an event deleted while the run
+    that counts it is in flight stays counted, and the rows deleted
+    by two requests at once are subtracted twice (the popularity
+    stays above the score of a recipe without events).
+
+    Args:
+        queryset: Rows of FavoriteRecipe or ShoppingList to be deleted.
+
+    """
+    name = SOURCE_NAMES[queryset.model]
+    checkpoint = RankingCheckpoint.objects.filter(name=name).filter(
+        Q(created__gt=OuterRef("created"))
+        | Q(created=OuterRef("created"), last_id__gte=OuterRef("id"))
+    )
+    events = queryset.filter(Exists(checkpoint)).values_list(
+        "recipe_id", "created"
+    )
+    RankingRemoval.objects.bulk_create([
+        RankingRemoval(source=name, recipe_id=recipe_id, created=created)
+        for recipe_id, created in events
+    ])
+
+
+def process_source(name, model, weight, batch_size, until) -> int:
+    """
+    Applies the next batch of events of the source after its
+    checkpoint and moves the checkpoint in the same transaction,
+    so every event is counted once. The next batch of the removed
+    events (see 'record_removals') is subtracted in the same way.
+
+    Returns:
+        count (int): Number of the processed and removed events.
+
+    """
+    with transaction.atomic():
+        checkpoint = RankingCheckpoint.objects.select_for_update().filter(
+            name=name
+        ).first()
+        events = model.objects.filter(created__lte=until)
+        if checkpoint is not None:
+            events = events.filter(
+                Q(created__gt=checkpoint.created)
+                | Q(created=checkpoint.created, id__gt=checkpoint.last_id)
+            )
+        events = list(events.order_by("created", "id").values_list(
+            "id", "recipe_id", "created"
+        )[:batch_size])
+        removals = list(RankingRemoval.objects.filter(
+            source=name
+        ).order_by("id").values_list("id", "recipe_id", "created")[
+            :batch_size
+        ])
+        if not events and not removals:
+            return 0
+
+        scores = defaultdict(lambda: -math.inf)
+        for _, recipe_id, created in events:
+            scores[recipe_id] = log_add(
+                scores[recipe_id], event_score(created, weight)
+            )
+        removed = defaultdict(lambda: -math.inf)
+        for _, recipe_id, created in removals:
+            removed[recipe_id] = log_add(
+                removed[recipe_id], event_score(created, weight)
+            )
+        apply_events(scores, removed)
+
+        if removals:
+            RankingRemoval.objects.filter(
+                id__in=[removal_id for removal_id, _, _ in removals]
+            ).delete()
+        if events:
+            last_id, _, last_created = events[-1]
+            RankingCheckpoint.objects.update_or_create(
+                name=name,
+                defaults={"created": last_created, "last_id": last_id}
+            )
+        return len(events) + len(removals)
+
+
+def update_popularity(batch_size=None) -> dict:
+    """
+    Adds the events that appeared since the previous run to the
+    popularity of the recipes. The events of the last SETTLE_SECONDS
+    are left for the next run (see 'settled_before').
+
+    Returns:
+        counts (dict): Number of the processed and removed events
+            of every source.
+
+    """
+    batch_size = batch_size or RANKING_SETTINGS["BATCH_SIZE"]
+    until = settled_before(RANKING_SETTINGS["SETTLE_SECONDS"])
+    counts = {}
+    for name, model, weight in SOURCES:
+        counts[name] = 0
+        while True:
+            processed = process_source(name, model, weight, batch_size, until)
+            counts[name] += processed
+            if processed < batch_size:
+                break
+    return counts
@@ -1,12 +1,113 @@
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 from recipes.models import Ingredient, Tag, RecipeIngredient, User, Recipe
 from .models import Subscription, ShoppingList, FavoriteRecipe
 
+BATCH_MAX_SIZE = 100
+IDS_PARAM = "ids"
+OMIT_USER_STATE_PARAM = "omit_user_state"
+FIELDS_PARAM = "fields"
+OMIT_PARAM = "omit"
+PANTRY_MAX_MISSING = 20
+USER_STATE_FIELDS = ("is_favorited", "is_in_shopping_cart", "is_subscribed")
 
-class UserSerializer(serializers.ModelSerializer):
+
+def omit_user_state(request) -> bool:
+    """
+    Checks whether the client asked to leave out the per-user fields
+    ('is_favorited', 'is_in_shopping_cart', 'is_subscribed'),
+    which makes the response the same for all users.
+
+    """
+    if request is None:
+        return False
+    value = request.GET.get(OMIT_USER_STATE_PARAM, "")
+    return value.lower() in ("1", "true")
+
+
+def get_field_selection(request):
+    """
+    Parses the sparse fieldset parameters of the request:
+    '?fields=id,name,author.username' and '?omit=text,ingredients'.
+    Nested fields are addressed with a dot.
+
+    Args:
+        request: Request or None.
+
+    Returns:
+        (only, omit): Set of the requested field paths or None
+        if all fields are requested, and set of the omitted paths.
+
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+    only = request.GET.get(FIELDS_PARAM)
+    omit = request.GET.get(OMIT_PARAM, "")
+    if only is not None:
+        only = {name.strip() for name in only.split(",") if name.strip()}
+    omit = {name.strip() for name in omit.split(",") if name.strip()}
+    return only or None, omit
+
+
+def is_field_selected(request, path) -> bool:
+    """
+    Checks whether the field (dotted path from the root serializer)
+    is present in the response, so the view can skip the queries
+    that only this field needs. The per-user flags are also
+    left out with '?omit_user_state=1'.
+
+    """
+    parts = path.split(".")
+    if parts[-1] in USER_STATE_FIELDS and omit_user_state(request):
+        return False
+    only, omit = get_field_selection(request)
+    for depth in range(1, len(parts) + 1):
+        if ".".join(parts[:depth]) in omit:
+            return False
+    if only is None:
+        return True
+    return any(
+        name == path
+        or name.startswith(f"{path}.")
+        or path.startswith(f"{name}.")
+        for name in only
+    )
+
+
+class SparseFieldsMixin:
+    """
+    Leaves in the serializer only the fields selected by the
+    '?fields=' and '?omit=' parameters of a read request.
+    Works for nested serializers too: their fields are matched
+    with the path from the root serializer ('author.username').
+
+    """
+    def get_field_path(self) -> str:
+        names = []
+        serializer = self
+        while serializer.parent is not None:
+            if serializer.field_name:
+                names.append(serializer.field_name)
+            serializer = serializer.parent
+        return ".".join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None:
+            return fields
+        path = self.get_field_path()
+        prefix = f"{path}." if path else ""
+        for name in list(fields):
+            if not is_field_selected(request, prefix + name):
+                fields.pop(name)
+        return fields
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Data serializer for the user model.
     Additionally adds the field whether
@@ -21,12 +122,24 @@ class UserSerializer(serializers.ModelSerializer):
                   "last_name", "is_subscribed")
 
     def get_is_subscribed(self, obj):
+        """
+        Uses the 'is_subscribed' annotation of the user list,
+        or the ids of the followed authors loaded once per request
+        when the user is nested in other objects.
+
+        """
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj.id
-        ).exists()
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        if "subscribed_ids" not in self.context:
+            self.context["subscribed_ids"] = set(
+                Subscription.objects.filter(
+                    user=request.user
+                ).values_list("author_id", flat=True)
+            )
+        return obj.id in self.context["subscribed_ids"]
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -39,7 +152,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Data serializer for the Tag model.
 
@@ -49,7 +162,8 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class RecipeIngredientsSerializer(serializers.ModelSerializer):
+class RecipeIngredientsSerializer(SparseFieldsMixin,
+                                  serializers.ModelSerializer):
     """
      Data serializer for the RecipeIngredient model.
      Added field 'measurement_unit' through the ingredient model.
@@ -76,7 +190,7 @@ class SubscriptionRecipeSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "image", "cooking_time")
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Data serializer for the Recipe model.
 
@@ -110,6 +224,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         return FavoriteRecipe.objects.filter(
             user=request.user, recipe=obj
         ).exists()
@@ -126,6 +242,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         return ShoppingList.objects.filter(
             user=request.user, recipe=obj
         ).exists()
@@ -292,7 +410,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return data
 
 
-class SubscriptionsSerializer(serializers.ModelSerializer):
+class SubscriptionsSerializer(SparseFieldsMixin,
+                              serializers.ModelSerializer):
     """
     Data serializer for the User model in case of subscriptions.
 
@@ -315,18 +434,25 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             user=obj.user, author=obj.author
         ).exists()
 
     def get_recipes(self, obj):
+        """
+        Uses the recipes prefetched for the page of subscriptions
+        if they are present, otherwise queries the recipes of the author.
+
+        """
         request = self.context.get("request")
         limit = request.GET.get("recipes_limit")
-        queryset = Recipe.objects.filter(author=obj.author)
+        queryset = getattr(obj.author, "subscription_recipes", None)
+        if queryset is None:
+            queryset = Recipe.objects.filter(author=obj.author)
         if limit is not None:
-            queryset = Recipe.objects.filter(
-                author=obj.author
-            )[:int(limit)]
+            queryset = queryset[:int(limit)]
 
         return SubscriptionRecipeSerializer(queryset, many=True).data
 
@@ -336,6 +462,8 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         Handler for getting the number of recipes created by the user.
 
         """
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
 
 
@@ -403,3 +531,38 @@ class ShoppingListSerializer(FavoriteRecipeSerializer):
         return SubscriptionRecipeSerializer(
             instance.recipe,
             context=context).data
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """
+    Data serializer for the list of object ids
+    passed to the batch endpoints.
+    URL = 'recipes/favorite/batch', 'recipes/shopping_cart/batch',
+    'users/subscribe/batch' or 'recipes/?ids=1,5,9'
+
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_SIZE
+    )
+
+    def validate_ids(self, ids):
+        # duplicates are collapsed, keeping the order of the request
+        return list(dict.fromkeys(ids))
+
+
+class PantrySerializer(serializers.Serializer):
+    """
+    Data serializer for the query of the pantry search.
+    URL = 'recipes/pantry/?ingredients=1,5,9&max_missing=1'
+
+    """
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_SIZE
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0, max_value=PANTRY_MAX_MISSING, default=0
+    )
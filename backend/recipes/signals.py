@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from foodgram.cache import cache, register_model_namespace, user_namespace
+
+from .models import (FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTombstone, ShoppingList, Subscription, Tag,
+                     refresh_favorites_count)
+from .ranking import record_removals
+
+register_model_namespace(Tag)
+register_model_namespace(Ingredient)
+# the cached recipe data (facets, bootstrap page) embeds the tags
+# and the ingredients
+register_model_namespace(Recipe, RecipeIngredient, Tag, Ingredient)
+
+
+@receiver(post_delete, sender=Recipe)
+def write_recipe_tombstone(sender, instance, **kwargs):
+    RecipeTombstone.objects.create(recipe_id=instance.pk)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Subscription)
+def bump_user_namespace(sender, instance, **kwargs):
+    cache.bump(user_namespace(instance.user_id))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_delete, sender=FavoriteRecipe)
+def update_favorites_count(sender, instance, **kwargs):
+    refresh_favorites_count([instance.recipe_id])
+
+
+@receiver(pre_delete, sender=FavoriteRecipe)
+@receiver(pre_delete, sender=ShoppingList)
+def record_ranking_removal(sender, instance, **kwargs):
+    record_removals(sender.objects.filter(pk=instance.pk))
@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import override_settings
+
+from foodgram.cache import cache
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+
+# the caches of the tests, with the shared one in its own directory
+TEST_CACHES = {
+    **settings.CACHES,
+    settings.SHARED_CACHE_ALIAS: {
+        **settings.CACHES[settings.SHARED_CACHE_ALIAS],
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(
+            tempfile.gettempdir(), "foodgram-tests", "cache"
+        ),
+    },
+}
+
+
+def isolated_caches(test_class):
+    """
+    Runs the tests of the class with TEST_CACHES, so they neither see
+    nor clear the shared cache of a running server.
+    """
+    return override_settings(CACHES=TEST_CACHES)(test_class)
+
+
+def create_users(count, prefix="user"):
+    return [
+        User.objects.create_user(
+            email=f"{prefix}{i}@example.com", username=f"{prefix}{i}",
+            first_name="Имя", last_name=f"Фамилия {i}", password="pass-12345"
+        )
+        for i in range(count)
+    ]
+
+
+def create_recipes(count, authors, ingredients_per_recipe=3):
+    """
+    Creates the recipes of the tests with one tag and a few
+    ingredients each, spread over the authors.
+
+    Returns:
+        recipes (list): Created recipes in the order of the id.
+
+    """
+    tags = [
+        Tag.objects.create(name=name, color="#E26C2D", slug=f"tag-{i}")
+        for i, (name, _) in enumerate(Tag.MEAL_TIME)
+    ]
+    ingredients = [
+        Ingredient.objects.create(name=f"ингредиент {i}", measurement_unit="г")
+        for i in range(10)
+    ]
+    recipes = []
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            name=f"Рецепт {i}", author=authors[i % len(authors)],
+            image=f"images/recipe-{i}.jpg", text="Смешать и запечь.",
+            cooking_time=5 + i
+        )
+        recipe.tags.add(tags[i % len(tags)])
+        for j in range(ingredients_per_recipe):
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredients=ingredients[(i + j) % len(ingredients)],
+                amount=10 + j
+            )
+        recipes.append(recipe)
+    return recipes
+
+
+def clear_caches():
+    """
+    Drops the cached data left by the previous tests.
+    """
+    for alias in caches:
+        caches[alias].clear()
+    cache.local.delete_many(lambda key: True)
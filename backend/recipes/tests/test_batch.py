@@ -0,0 +1,80 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingList, Subscription
+
+from .base import create_recipes, create_users, isolated_caches
+
+
+@isolated_caches
+class BatchEndpointsTest(TestCase):
+    """
+    The batch endpoints change all the links with one statement,
+    whatever the number of the ids.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = create_users(4)
+        cls.recipes = create_recipes(30, cls.authors)
+        cls.ids = [recipe.id for recipe in cls.recipes]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_favorites(self):
+        url = "/api/recipes/favorite/batch/"
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                url, {"ids": self.ids + [10 ** 9]}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        statuses = [item["status"] for item in response.json()["results"]]
+        self.assertEqual(statuses, ["created"] * 30 + ["not_found"])
+        self.assertEqual(
+            set(Recipe.objects.values_list("favorites_count", flat=True)),
+            {1}
+        )
+
+        # the removed favorites are checked against the ranking
+        with self.assertNumQueries(4):
+            response = self.client.delete(
+                url, {"ids": self.ids[:20]}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            FavoriteRecipe.objects.filter(user=self.user).count(), 10
+        )
+        self.assertEqual(
+            Recipe.objects.filter(favorites_count=0).count(), 20
+        )
+
+    def test_shopping_cart(self):
+        url = "/api/recipes/shopping_cart/batch/"
+        with self.assertNumQueries(2):
+            self.client.post(url, {"ids": self.ids}, format="json")
+        self.assertEqual(
+            ShoppingList.objects.filter(user=self.user).count(), 30
+        )
+        with self.assertNumQueries(3):
+            response = self.client.delete(
+                url, {"ids": self.ids[:10]}, format="json"
+            )
+        statuses = {item["status"] for item in response.json()["results"]}
+        self.assertEqual(statuses, {"deleted"})
+        with self.assertNumQueries(2):
+            response = self.client.delete("/api/recipes/shopping_cart/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShoppingList.objects.filter(user=self.user).exists())
+
+    def test_subscriptions(self):
+        url = "/api/users/subscribe/batch/"
+        ids = [author.id for author in self.authors] + [self.user.id]
+        with self.assertNumQueries(2):
+            response = self.client.post(url, {"ids": ids}, format="json")
+        statuses = [item["status"] for item in response.json()["results"]]
+        self.assertEqual(statuses, ["created"] * 3 + ["invalid"])
+        with self.assertNumQueries(2):
+            self.client.delete(url, {"ids": ids}, format="json")
+        self.assertFalse(Subscription.objects.exists())
@@ -0,0 +1,49 @@
+from django.db import IntegrityError, OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from foodgram.middleware import CircuitBreakerMiddleware
+from recipes.models import Tag
+
+
+@override_settings(DB_CIRCUIT_BREAKER={
+    "WINDOW": 60, "MIN_QUERIES": 5, "ERROR_RATE": 0.5, "SLOW_RATE": 1.0,
+    "SLOW_QUERY": 60.0, "COOLDOWN": 60,
+})
+class CircuitBreakerMiddlewareTest(TestCase):
+    """
+    Only the failures of the database itself open the breaker,
+    the rejected data (constraint violations) doesn't.
+    """
+
+    def setUp(self):
+        self.request = RequestFactory().get("/api/recipes/")
+
+    def run_requests(self, statement, error):
+        def get_response(request):
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(statement)
+            except error:
+                pass
+            return HttpResponse()
+
+        middleware = CircuitBreakerMiddleware(get_response)
+        return [middleware(self.request).status_code for _ in range(10)]
+
+    def test_integrity_errors_keep_breaker_closed(self):
+        Tag.objects.create(name="Завтрак", color="#E26C2D", slug="breakfast")
+        statement = (
+            f"INSERT INTO {Tag._meta.db_table} (name, color, slug) "
+            "VALUES ('Обед', '#E26C2D', 'breakfast')"
+        )
+        self.assertEqual(
+            self.run_requests(statement, IntegrityError), [200] * 10
+        )
+
+    def test_operational_errors_open_breaker(self):
+        statuses = self.run_requests(
+            "SELECT * FROM missing_table", OperationalError
+        )
+        self.assertEqual(statuses[:5], [200] * 5)
+        self.assertEqual(statuses[5:], [503] * 5)
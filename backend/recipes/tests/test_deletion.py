@@ -0,0 +1,204 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from foodgram.cache import cache, model_namespace, user_namespace
+from recipes.deletion import (TOMBSTONE_RETENTION, delete_recipes,
+                              process_deletions, schedule_deletion)
+from recipes.models import (FavoriteRecipe, Recipe, RecipeIngredient,
+                            RecipeTombstone, ScheduledDeletion, ShoppingList,
+                            Subscription, User)
+from users.authentication import CachedTokenAuthentication, local_cache
+
+from .base import (clear_caches, create_recipes, create_users,
+                   isolated_caches)
+
+
+@isolated_caches
+class DeletionTest(TestCase):
+    """
+    The chunked deletes skip the signals of the models (raw DELETE),
+    so their work is checked here: tombstones, counters, caches
+    and tokens.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author, cls.other = create_users(3)
+        cls.recipes = create_recipes(6, [cls.author, cls.other])
+        cls.author_recipes = [recipe for recipe in cls.recipes
+                              if recipe.author_id == cls.author.pk]
+        cls.other_recipe = next(recipe for recipe in cls.recipes
+                                if recipe.author_id == cls.other.pk)
+        for recipe in cls.recipes:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        FavoriteRecipe.objects.create(user=cls.author, recipe=cls.other_recipe)
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        Subscription.objects.create(user=cls.author, author=cls.other)
+
+    def setUp(self):
+        clear_caches()
+        local_cache.clear()
+
+    def assert_recipes_deleted(self, recipe_ids):
+        self.assertFalse(Recipe.objects.filter(id__in=recipe_ids).exists())
+        for model in (RecipeIngredient, Recipe.tags.through,
+                      FavoriteRecipe, ShoppingList):
+            self.assertFalse(
+                model.objects.filter(recipe_id__in=recipe_ids).exists()
+            )
+        self.assertEqual(
+            sorted(RecipeTombstone.objects.values_list(
+                "recipe_id", flat=True
+            )),
+            sorted(recipe_ids)
+        )
+
+    def test_delete_recipes(self):
+        recipe_ids = [recipe.id for recipe in self.author_recipes]
+        versions = (cache.namespace_version(model_namespace(Recipe)),
+                    cache.namespace_version(user_namespace(self.user.pk)))
+        cache.local.delete_many(lambda key: True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(delete_recipes(recipe_ids, chunk_size=2), 3)
+
+        self.assert_recipes_deleted(recipe_ids)
+        self.assertEqual(
+            FavoriteRecipe.objects.filter(user=self.user).count(), 3
+        )
+        self.assertGreater(
+            cache.namespace_version(model_namespace(Recipe)), versions[0]
+        )
+        self.assertGreater(
+            cache.namespace_version(user_namespace(self.user.pk)),
+            versions[1]
+        )
+
+    def test_scheduled_user_deletion(self):
+        token = Token.objects.create(user=self.author)
+        auth = CachedTokenAuthentication()
+        auth.authenticate_credentials(token.key)
+        stale_entry = local_cache.get(token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_deletion(user_ids=[self.author.pk])
+        self.assertTrue(User.objects.filter(pk=self.author.pk).exists())
+        local_cache.set(token.key, stale_entry)
+        with self.assertRaises(AuthenticationFailed):
+            auth.authenticate_credentials(token.key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "process_deletions", chunk_size=2, stdout=StringIO()
+            )
+
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+        self.assertFalse(ScheduledDeletion.objects.exists())
+        self.assert_recipes_deleted(
+            [recipe.id for recipe in self.author_recipes]
+        )
+        self.assertFalse(Subscription.objects.filter(
+            author=self.author
+        ).exists())
+        self.assertFalse(Subscription.objects.filter(
+            user=self.author
+        ).exists())
+        self.other_recipe.refresh_from_db()
+        self.assertEqual(self.other_recipe.favorites_count, 1)
+
+
+@isolated_caches
+class AdminDeletionPermissionsTest(TestCase):
+    """
+    The admin refuses to delete a user when the staff user may not
+    delete the recipes, favorites or subscriptions deleted with them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff, cls.author = create_users(2)
+        cls.staff.is_staff = True
+        cls.staff.save()
+        create_recipes(2, [cls.author])
+        cls.url = f"/admin/users/appuser/{cls.author.pk}/delete/"
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def only_permissions(self, *perms):
+        return mock.patch.object(
+            User, "has_perm", lambda user, perm, obj=None: perm in perms
+        )
+
+    def test_cascaded_models_need_permissions(self):
+        with self.only_permissions("users.view_appuser",
+                                   "users.delete_appuser"):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("recipe", response.context["perms_lacking"])
+            response = self.client.post(self.url, {"post": "yes"})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ScheduledDeletion.objects.exists())
+
+    def test_deletion_with_permissions(self):
+        with self.only_permissions("users.view_appuser",
+                                   "users.delete_appuser",
+                                   "recipes.delete_recipe"):
+            response = self.client.post(self.url, {"post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(ScheduledDeletion.objects.filter(
+            kind=ScheduledDeletion.USER, object_id=self.author.pk
+        ).exists())
+
+
+@isolated_caches
+class TombstoneRetentionTest(TestCase):
+    """
+    The tombstones older than the retention are removed, and the changes
+    feed refuses the tokens which could have missed them.
+    """
+    url = "/api/recipes/changes/"
+
+    def setUp(self):
+        clear_caches()
+        now = timezone.now()
+        for recipe_id, age in ((1, TOMBSTONE_RETENTION + timedelta(days=1)),
+                               (2, timedelta(days=1))):
+            tombstone = RecipeTombstone.objects.create(recipe_id=recipe_id)
+            RecipeTombstone.objects.filter(pk=tombstone.pk).update(
+                deleted=now - age
+            )
+
+    def test_expired_tombstones_are_pruned(self):
+        counts = process_deletions()
+        self.assertEqual(counts["tombstones"], 1)
+        self.assertEqual(
+            list(RecipeTombstone.objects.values_list("recipe_id", flat=True)),
+            [2]
+        )
+
+    def test_expired_token_is_refused(self):
+        response = self.client.get(self.url, {"limit": 1})
+        self.assertEqual(response.json()["deleted"], [1])
+        token = response.json()["next"]
+        self.assertEqual(
+            self.client.get(self.url, {"since": token}).status_code, 410
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["deleted"], [1, 2])
+        process_deletions()
+        response = self.client.get(
+            self.url, {"since": response.json()["next"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["deleted"], [])
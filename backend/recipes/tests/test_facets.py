@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes import filters
+from recipes.models import FavoriteRecipe, ShoppingList, Tag
+
+from .base import (clear_caches, create_recipes, create_users,
+                   isolated_caches)
+
+
+@isolated_caches
+class FacetsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = create_users(5)
+        # the first author has the most recipes, the last one the fewest
+        cls.recipes = create_recipes(
+            15, cls.authors[:1] * 5 + cls.authors[1:4] * 3
+            + cls.authors[4:] * 1
+        )
+        cls.user = cls.authors[4]
+        cls.favorites = cls.recipes[:9]
+        cls.shopping_list = cls.recipes[::2]
+        for recipe in cls.favorites:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.shopping_list:
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+
+    def test_tag_change_invalidates_counts(self):
+        response = self.client.get("/api/recipes/facets/?tags=tag-0")
+        self.assertEqual(response.status_code, 200)
+        tag = Tag.objects.get(slug="tag-0")
+        tag.slug = "renamed"
+        tag.save()
+        response = self.client.get("/api/recipes/facets/?tags=tag-0")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/recipes/facets/?tags=renamed")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("renamed", [
+            item["slug"] for item in response.json()["tags"]
+        ])
+
+    def test_authors_are_limited(self):
+        with mock.patch.object(filters, "FACET_AUTHORS_LIMIT", 2):
+            response = self.client.get("/api/recipes/facets/")
+        authors = response.json()["authors"]
+        self.assertEqual(len(authors), 2)
+        self.assertEqual(authors[0]["id"], self.authors[0].id)
+        self.assertEqual(response.json()["total"], 15)
+
+    def test_counts_under_filters(self):
+        """
+        Every facet is counted with the other filters of the request:
+        here the favorites of the user with the first tag.
+        """
+        self.client.force_authenticate(self.user)
+        response = self.client.get(
+            "/api/recipes/facets/?tags=tag-0&is_favorited=1"
+        )
+        self.assertEqual(response.status_code, 200)
+        counts = response.json()
+
+        def slugs(recipe):
+            return {tag.slug for tag in recipe.tags.all()}
+
+        favorites = [recipe for recipe in self.favorites
+                     if "tag-0" in slugs(recipe)]
+        self.assertEqual(counts["total"], len(favorites))
+        self.assertEqual(
+            {tag["slug"]: tag["count"] for tag in counts["tags"]},
+            {slug: sum(slug in slugs(recipe) for recipe in self.favorites)
+             for slug in ("tag-0", "tag-1", "tag-2")}
+        )
+        self.assertEqual(counts["is_favorited"], len(favorites))
+        self.assertEqual(
+            counts["is_in_shopping_cart"],
+            len([recipe for recipe in favorites
+                 if recipe in self.shopping_list])
+        )
+        self.assertEqual(
+            sum(author["count"] for author in counts["authors"]),
+            len(favorites)
+        )
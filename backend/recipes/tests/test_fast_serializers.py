@@ -0,0 +1,104 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipes.fast_serializers import (ValuesSerializer, recipe_columns,
+                                      serialize_recipes)
+from recipes.filters import RecipeFilter
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingList,
+                            Subscription, Tag)
+from recipes.serializers import (IngredientSerializer, RecipeSerializer,
+                                 TagSerializer)
+from recipes.views import prune_recipe_queryset
+
+from .base import create_recipes, create_users, isolated_caches
+
+
+@isolated_caches
+class ValuesSerializerContractTest(TestCase):
+    """
+    The values() fast path must give byte for byte the same JSON
+    as the DRF serializers on model instances.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *authors = create_users(3)
+        cls.recipes = create_recipes(8, authors + [cls.user])
+        for recipe in cls.recipes[::2]:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(user=cls.user, author=authors[0])
+
+    def make_request(self, user, params=None):
+        request = Request(APIRequestFactory().get("/api/recipes/", params))
+        request.user = user
+        return request
+
+    def serializer_data(self, request):
+        # the plain queryset without the annotations of the list,
+        # so the serializer computes the flags itself
+        queryset = prune_recipe_queryset(
+            Recipe.objects.order_by("-id"), request
+        )
+        return RecipeSerializer(
+            queryset, many=True, context={"request": request}
+        ).data
+
+    def values_data(self, request):
+        serializer = RecipeSerializer(context={"request": request})
+        queryset = RecipeFilter.filter_recipe_queryset(request).order_by("-id")
+        rows = list(queryset.values(*recipe_columns(serializer, queryset)))
+        return serialize_recipes(serializer, rows, request)
+
+    def assertSameJSON(self, first, second):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(first), renderer.render(second))
+
+    def test_recipes_anonymous(self):
+        request = self.make_request(AnonymousUser())
+        self.assertSameJSON(
+            self.serializer_data(request), self.values_data(request)
+        )
+
+    def test_recipes_authenticated(self):
+        request = self.make_request(self.user)
+        data = self.values_data(request)
+        self.assertSameJSON(self.serializer_data(request), data)
+        flags = {
+            (item["id"], item["is_favorited"], item["is_in_shopping_cart"])
+            for item in data
+        }
+        self.assertEqual(flags, {
+            (recipe.id, i % 2 == 0, i % 3 == 0)
+            for i, recipe in enumerate(self.recipes)
+        })
+        self.assertTrue(any(
+            item["author"]["is_subscribed"] for item in data
+        ))
+
+    def test_recipes_sparse_fields(self):
+        request = self.make_request(
+            self.user, {"fields": "id,name,author.id,is_favorited"}
+        )
+        self.assertSameJSON(
+            self.serializer_data(request), self.values_data(request)
+        )
+
+    def test_tags_and_ingredients(self):
+        request = self.make_request(AnonymousUser())
+        for model, serializer_class in ((Tag, TagSerializer),
+                                        (Ingredient, IngredientSerializer)):
+            with self.subTest(model=model.__name__):
+                queryset = model.objects.order_by("id")
+                serializer = serializer_class(context={"request": request})
+                values = ValuesSerializer(serializer)
+                self.assertSameJSON(
+                    serializer_class(
+                        queryset, many=True, context={"request": request}
+                    ).data,
+                    values.serialize(queryset.values(*values.columns))
+                )
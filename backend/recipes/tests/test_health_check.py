@@ -0,0 +1,55 @@
+import threading
+from unittest import mock
+
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase
+
+from foodgram.middleware import DatabaseHealthCheckMiddleware
+
+
+class DatabaseHealthCheckMiddlewareTest(TransactionTestCase):
+    """
+    Every thread checks its own connection, whatever the other
+    threads of the worker checked.
+    """
+
+    def setUp(self):
+        self.middleware = DatabaseHealthCheckMiddleware(
+            lambda request: HttpResponse()
+        )
+        self.request = RequestFactory().get("/api/recipes/")
+        self.checked = []
+        # checked by the requests of the previous tests
+        connections["default"].__dict__.pop("health_checked", None)
+
+    def is_usable(self):
+        self.checked.append(threading.get_ident())
+        return True
+
+    def run_request(self):
+        connection.ensure_connection()
+        self.middleware(self.request)
+
+    def run_in_thread(self):
+        def target():
+            try:
+                self.run_request()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+    def test_connections_are_checked_per_thread(self):
+        with mock.patch.object(
+            type(connections["default"]), "is_usable", self.is_usable
+        ):
+            self.run_request()
+            self.run_request()
+            self.run_in_thread()
+            self.run_in_thread()
+        self.assertEqual(len(self.checked), 3)
+        self.assertEqual(self.checked[0], threading.get_ident())
+        self.assertNotIn(threading.get_ident(), self.checked[1:])
@@ -0,0 +1,80 @@
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipes.filters import RECIPE_ORDERINGS, RecipeFilter
+from recipes.management.commands.benchmark import SORT_MARKERS
+from recipes.models import Recipe
+
+from .base import create_recipes, create_users
+
+
+class RecipeOrderingPlanTest(TestCase):
+    """
+    Every ordering of the recipe list reads the page from its index
+    instead of sorting the table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(50, create_users(2))
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            # the tables of the tests are small enough for a sequential
+            # scan, the question is whether the index fits the ordering
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def get_plan(self, params):
+        request = Request(APIRequestFactory().get("/api/recipes/", params))
+        request.user = AnonymousUser()
+        filterset = RecipeFilter(
+            request.GET,
+            queryset=RecipeFilter.filter_recipe_queryset(request),
+            request=request
+        )
+        return filterset.qs[:6].explain()
+
+    def get_index(self, fields):
+        indexes = {tuple(index.fields): index.name
+                   for index in Recipe._meta.indexes}
+        index = indexes.get(tuple(field.lstrip("-") for field in fields))
+        self.assertIsNotNone(index, f"no index for {fields}")
+        return index
+
+    def has_sort(self, plan):
+        return any(marker in plan for marker in SORT_MARKERS)
+
+    def test_orderings_use_index(self):
+        for ordering, fields in RECIPE_ORDERINGS.items():
+            with self.subTest(ordering=ordering):
+                plan = self.get_plan({"ordering": ordering})
+                self.assertIn(self.get_index(fields), plan)
+                self.assertFalse(self.has_sort(plan), plan)
+
+    def test_cooking_time_range_plans(self):
+        """
+        With a cooking time range the page is read from the index
+        of the ordering with the range as a filter, or the range is
+        read from the cooking time index and only its rows are sorted
+        (see RecipeFilter). 'fastest' never sorts.
+        """
+        range_index = self.get_index(RECIPE_ORDERINGS["fastest"])
+        for ordering, fields in RECIPE_ORDERINGS.items():
+            with self.subTest(ordering=ordering):
+                plan = self.get_plan({
+                    "ordering": ordering,
+                    "cooking_time_min": 10,
+                    "cooking_time_max": 30,
+                })
+                index = self.get_index(fields)
+                if index == range_index or (
+                        index in plan and range_index not in plan):
+                    self.assertIn(index, plan)
+                    self.assertFalse(self.has_sort(plan), plan)
+                else:
+                    self.assertIn(range_index, plan)
+                    self.assertTrue(self.has_sort(plan), plan)
@@ -0,0 +1,54 @@
+import io
+import os
+import pstats
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from monitoring.profiling import SamplingProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def outer(seconds):
+    busy(seconds)
+
+
+class SamplingProfilerTest(SimpleTestCase):
+    """
+    The samples are dumped in the pstats format read by the admin.
+    """
+
+    def test_samples_are_pstats(self):
+        profiler = SamplingProfiler(0.001)
+        profiler.enable()
+        try:
+            outer(0.2)
+        finally:
+            profiler.disable()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.prof")
+            profiler.dump_stats(path)
+            stream = io.StringIO()
+            stats = pstats.Stats(path, stream=stream)
+            stats.sort_stats("cumulative").print_stats(3)
+
+        functions = {function[2]: values
+                     for function, values in stats.stats.items()}
+        cc, nc, tt, ct, callers = functions["busy"]
+        self.assertGreater(ct, 0.1)
+        self.assertAlmostEqual(tt, ct)
+        self.assertIn("outer", {caller[2] for caller in callers})
+        self.assertGreater(functions["outer"][3], 0.1)
+        # the stacks start at the caller of enable()
+        self.assertEqual(
+            {function[2] for function, values in stats.stats.items()
+             if not values[4]},
+            {"test_samples_are_pstats"}
+        )
+        self.assertIn("outer", stream.getvalue())
@@ -0,0 +1,78 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoriteRecipe, RankingRemoval, Recipe,
+                            ShoppingList)
+from recipes.ranking import RANKING_SETTINGS, update_popularity
+
+from .base import (clear_caches, create_recipes, create_users,
+                   isolated_caches)
+
+
+@isolated_caches
+@mock.patch.dict(RANKING_SETTINGS, {"SETTLE_SECONDS": 0})
+class PopularityTest(TestCase):
+    """
+    The removed favorites and shopping list entries are subtracted
+    from the popularity by the next run, whichever way they are deleted.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = create_users(2)
+        cls.recipes = create_recipes(2, [cls.other])
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def popularity(self):
+        return list(Recipe.objects.order_by("id").values_list(
+            "popularity", flat=True
+        ))
+
+    def test_removed_events_are_subtracted(self):
+        first, second = self.recipes
+        FavoriteRecipe.objects.create(user=self.other, recipe=first)
+        for recipe in self.recipes:
+            FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+        update_popularity()
+        before = self.popularity()
+        self.assertGreater(before[0], before[1])
+
+        FavoriteRecipe.objects.get(user=self.other).delete()
+        update_popularity()
+        after = self.popularity()
+        self.assertAlmostEqual(after[0], after[1], places=6)
+
+        self.client.delete("/api/recipes/favorite/batch/",
+                           {"ids": [first.id, second.id]}, format="json")
+        self.client.delete("/api/recipes/shopping_cart/")
+        update_popularity()
+        self.assertEqual(self.popularity(), [0, 0])
+        self.assertFalse(RankingRemoval.objects.exists())
+
+    def test_uncounted_events_are_not_subtracted(self):
+        first, second = self.recipes
+        FavoriteRecipe.objects.create(user=self.user, recipe=first)
+        update_popularity()
+        before = self.popularity()
+        favorite = FavoriteRecipe.objects.create(
+            user=self.user, recipe=second
+        )
+        favorite.delete()
+        self.assertFalse(RankingRemoval.objects.exists())
+        update_popularity()
+        self.assertEqual(self.popularity(), before)
+
+    def test_popular_pages_have_count(self):
+        url = "/api/recipes/?ordering=popular&limit=1"
+        response = self.client.get(url)
+        self.assertEqual(response.json()["count"], 2)
+        response = self.client.get(response.json()["next"])
+        self.assertEqual(response.json()["count"], 2)
+        self.assertIsNone(response.json()["next"])
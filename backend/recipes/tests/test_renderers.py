@@ -0,0 +1,30 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.renderers import ORJSONRenderer
+
+
+class ORJSONRendererTest(SimpleTestCase):
+
+    def render(self, data):
+        return JSONRenderer().render(data), ORJSONRenderer().render(data)
+
+    def test_same_bytes_without_floats(self):
+        expected, content = self.render({
+            "name": "Борщ\u2028«по-домашнему»",
+            "created": datetime(2021, 9, 1, 12, 30, tzinfo=timezone.utc),
+            "amount": Decimal("1.50"),
+            "tags": [1, 2, None, True],
+            1: "numeric key",
+        })
+        self.assertEqual(content, expected)
+
+    def test_same_values_with_floats(self):
+        data = {"scores": [1e16, 0.00001, 0.1, 1.5, -0.0]}
+        expected, content = self.render(data)
+        self.assertNotEqual(content, expected)
+        self.assertEqual(json.loads(content), json.loads(expected))
@@ -0,0 +1,41 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from foodgram.cache import shared_cache
+from foodgram.db_routers import (PrimaryReplicaRouter, is_sticky,
+                                 mark_sticky, set_replica_reads)
+from recipes.models import Recipe
+
+from .base import isolated_caches
+
+
+@isolated_caches
+@mock.patch("foodgram.db_routers.replica_aliases",
+            lambda: [f"replica_{i}" for i in range(8)])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def tearDown(self):
+        set_replica_reads(False)
+
+    def test_reads_of_request_go_to_one_replica(self):
+        set_replica_reads(True)
+        aliases = {self.router.db_for_read(Recipe) for _ in range(50)}
+        self.assertEqual(len(aliases), 1)
+        self.assertTrue(aliases.pop().startswith("replica_"))
+        self.assertEqual(self.router.db_for_write(Recipe), "default")
+
+    def test_reads_go_to_primary_when_disabled(self):
+        set_replica_reads(True)
+        set_replica_reads(False)
+        self.assertEqual(self.router.db_for_read(Recipe), "default")
+
+    def test_sticky_marker_is_shared(self):
+        shared_cache().clear()
+        self.assertFalse(is_sticky(1))
+        mark_sticky(1)
+        self.assertTrue(is_sticky(1))
+        self.assertFalse(is_sticky(2))
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+
+from foodgram.db import StatementTimeoutSetter
+from recipes.models import Tag
+
+
+class StatementTimeoutSetterTest(TransactionTestCase):
+    """
+    The commands of the setter are recorded instead of being run,
+    the transactions it opens are real.
+    """
+
+    def setUp(self):
+        self.commands = []
+        self.setter = StatementTimeoutSetter(lambda: 1000)
+
+    def record(self, connection, command, params=None):
+        self.commands.append((command, connection.in_atomic_block))
+
+    def wrapper(self, execute, sql, params, many, context):
+        # SQLite starts the transactions with a statement, PostgreSQL doesn't
+        if sql == "BEGIN":
+            return execute(sql, params, many, context)
+        return self.setter(execute, sql, params, many, context)
+
+    def run_queries(self, pooler, queries):
+        with mock.patch("foodgram.db.behind_pooler", lambda _: pooler), \
+                mock.patch.object(self.setter, "run", self.record), \
+                connection.execute_wrapper(self.wrapper):
+            try:
+                queries()
+            finally:
+                self.setter.reset()
+
+    def test_session_timeout_is_set_once(self):
+        def queries():
+            Tag.objects.count()
+            Tag.objects.count()
+            self.assertFalse(connection.in_atomic_block)
+
+        self.run_queries(False, queries)
+        self.assertEqual(self.commands, [
+            ("SET statement_timeout = %s", False),
+            ("SET statement_timeout TO DEFAULT", False),
+        ])
+
+    def test_pooler_timeout_is_set_in_transactions(self):
+        def queries():
+            with transaction.atomic():
+                Tag.objects.count()
+                Tag.objects.count()
+            Tag.objects.count()
+            Tag.objects.count()
+            self.assertTrue(connection.in_atomic_block)
+
+        self.run_queries(True, queries)
+        self.assertEqual(
+            self.commands, [("SET LOCAL statement_timeout = %s", True)] * 2
+        )
+        self.assertFalse(connection.in_atomic_block)
+
+    def test_pooler_transaction_is_rolled_back(self):
+        def queries():
+            Tag.objects.create(name="Завтрак", color="#E26C2D",
+                               slug="breakfast")
+            self.setter.rollback()
+
+        self.run_queries(True, queries)
+        self.assertFalse(Tag.objects.exists())
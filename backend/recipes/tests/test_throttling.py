@@ -0,0 +1,47 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase
+
+from recipes.throttling import ActionScopedThrottle
+
+
+class View(object):
+    action = "list"
+    throttle_scopes = {"list": "batch"}
+
+
+class ActionScopedThrottleTest(SimpleTestCase):
+    """
+    The wait of a refused request lasts until the weighted count
+    of the previous window lets the next request in ('batch' allows
+    30 requests a minute).
+    """
+
+    def setUp(self):
+        ActionScopedThrottle.cache.clear()
+        self.request = RequestFactory().get("/api/recipes/")
+        self.request.user = AnonymousUser()
+
+    def allow(self, counts, elapsed):
+        throttle = ActionScopedThrottle()
+        throttle.timer = lambda: 600 + elapsed
+        key = "throttle:batch:127.0.0.1"
+        ActionScopedThrottle.cache.set_many({
+            f"{key}:{10 - age}": count for age, count in enumerate(counts)
+        })
+        return throttle.allow_request(self.request, View()), throttle.wait()
+
+    def test_wait_for_previous_window(self):
+        # 30 * 0.75 + 10 requests, 30 * 0.5 + 10 five seconds later
+        allowed, wait = self.allow([10, 30], 15)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 5)
+
+    def test_wait_for_full_current_window(self):
+        # the 40 requests of the window are weighted by 0.75 fifteen
+        # seconds into the next one
+        allowed, wait = self.allow([40, 0], 30)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 45)
+
+    def test_allowed_below_limit(self):
+        self.assertEqual(self.allow([10, 20], 15), (True, None))
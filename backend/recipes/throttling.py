@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ActionScopedThrottle(SimpleRateThrottle):
+    """
+    Throttle with the budget chosen by the action of the viewset:
+    'throttle_scopes[action]' names the rate in DEFAULT_THROTTLE_RATES,
+    the actions without a scope are not limited.
+
+    Requests are counted per user, or per IP address for anonymous
+    users, with the sliding window counter algorithm: the count
+    of the previous fixed window weighted by its overlap with
+    the sliding window plus the count of the current window.
+    It keeps two integers per client in the local cache
+    instead of the list of request times of the DRF throttles.
+
+    The counters are local to the worker process, so the budget
+    is per worker (see THROTTLE_CACHE_ALIAS in the settings).
+    """
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    def __init__(self):
+        # the scope and the rate depend on the view, see allow_request()
+        self.wait_seconds = None
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, "throttle_scopes", {}).get(
+            getattr(view, "action", None)
+        )
+        if self.scope is None:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        key = self.get_cache_key(request, view)
+
+        now = self.timer()
+        window = int(now // self.duration)
+        elapsed = now - window * self.duration
+        current_key = f"{key}:{window}"
+        previous_key = f"{key}:{window - 1}"
+        counts = self.cache.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+        weight = 1 - elapsed / self.duration
+
+        if previous * weight + current >= self.num_requests:
+            self.wait_seconds = self.get_wait(current, previous, elapsed)
+            return False
+        if not self.cache.add(current_key, 1, self.duration * 2):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                # the key expired between add() and incr()
+                self.cache.set(current_key, 1, self.duration * 2)
+        return True
+
+    def get_wait(self, current, previous, elapsed):
+        """
+        Returns the seconds until the weighted count
+        drops below the number of allowed requests.
+
+        When the current window is full, its count becomes the
+        previous one at the end of the window and is weighted down
+        from there like the previous count now.
+        """
+        remaining = self.duration - elapsed
+        if current >= self.num_requests:
+            return remaining + self.duration * (
+                1 - self.num_requests / current
+            )
+        free = self.num_requests - current
+        wait = self.duration * (1 - free / previous) - elapsed
+        return min(max(wait, 1), remaining)
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import AppUserViewSet, TagViewSet, IngredientsViewSet, RecipeViewSet
+from .views import (AppUserViewSet, BootstrapViewSet, TagViewSet,
+                    IngredientsViewSet, RecipeViewSet)
 
 
 app_name = "recipes"
@@ -11,6 +12,7 @@ router.register("users", AppUserViewSet, basename="users")
 router.register("tags", TagViewSet, basename="tags")
 router.register("ingredients", IngredientsViewSet, basename="ingredients")
 router.register("recipes", RecipeViewSet, basename="recipes")
+router.register("bootstrap", BootstrapViewSet, basename="bootstrap")
 
 
 urlpatterns = [
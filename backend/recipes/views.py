@@ -1,30 +1,390 @@
-from django.db.models import F, Sum
+import copy
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from urllib.parse import urlencode
+
+import numpy as np
+
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Q, Sum, Value)
+from django.http import QueryDict
 from django.http.response import HttpResponse
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
 
+from djoser.conf import settings as djoser_settings
 from djoser.views import UserViewSet
 
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram.cache import cache, model_namespace, user_namespace
+from foodgram.db import (StatementTimeoutMixin, estimate_count,
+                         settled_before)
+from foodgram.db_routers import ReplicaReadMixin
 
+from .deletion import (delete_recipes, raw_delete, schedule_deletion,
+                       tombstone_cutoff)
+from .fast_serializers import (INGREDIENT_ORDERING, TAG_ORDERING,
+                               ValuesSerializer, recipe_columns,
+                               serialize_recipes)
 from .filters import IngredientFilter, RecipeFilter
-from .models import (User, Ingredient, Tag, Recipe,
-                     Subscription, FavoriteRecipe, ShoppingList, RecipeIngredient)
+from .ingredient_index import pantry_recipes, similar_recipes
+from .models import (User, Ingredient, Tag, Recipe, RecipeTombstone,
+                     Subscription, FavoriteRecipe, ShoppingList, RecipeIngredient,
+                     refresh_favorites_count)
 from .permissions import IsOwnerOrAdminOrReadOnly
+from .ranking import SOURCE_NAMES, record_removals
 from .serializers import (UserSerializer, IngredientSerializer,
                           TagSerializer, RecipeSerializer,
                           SubscriptionSerializer, FavoriteRecipeSerializer,
-                          ShoppingListSerializer, SubscriptionsSerializer)
+                          ShoppingListSerializer, SubscriptionsSerializer,
+                          BatchIdsSerializer, PantrySerializer, IDS_PARAM,
+                          is_field_selected)
+
+
+CHANGES_FEEDS = ("recipes", "deleted")
+# changes are reported once they are older than this (see 'settled_before')
+CHANGES_SETTLE_SECONDS = 5
 
 
 class AppPagination(PageNumberPagination):
     page_size_query_param = "limit"
+    max_page_size = 100
+
+
+class KeysetPagination(AppPagination):
+    """
+    Pagination by the position of the last row of the page
+    in the descending (field, id) order instead of the page number,
+    for the orderings that change often (e.g. 'ordering=popular'):
+    the pages don't shift when the rows are reranked, and the
+    deep pages cost as much as the first one.
+
+    The page is taken from a values() queryset which must
+    contain the field and the id. The 'count' of the list is
+    estimated when it is unfiltered (see 'estimate_count').
+
+    """
+    cursor_query_param = "cursor"
+
+    def __init__(self, field):
+        self.field = field
+        self.keyset_fields = (field, "id")
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_b64decode(token.encode()))
+            return float(value), int(pk)
+        except (ValueError, TypeError):
+            raise NotFound("Invalid cursor")
+
+    def get_count(self, queryset) -> int:
+        count = estimate_count(queryset)
+        if count is None:
+            count = queryset.order_by().count()
+        return count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count = self.get_count(queryset)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f"{self.field}__lt": value})
+                | Q(**{self.field: value, "id__lt": pk})
+            )
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = urlsafe_b64encode(json.dumps(
+                [rows[-1][self.field], rows[-1]["id"]]
+            ).encode()).decode()
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.count,
+            "next": self.get_next_link(),
+            "previous": None,
+            "results": data,
+        })
+
+
+class CachedListMixin:
+    """
+    Serves the 'list' action from the layered cache.
+    The cache key is built from the query parameters,
+    and the namespace of the model is bumped on its changes.
+
+    """
+    cache_ttl = 60
+    cache_stale_ttl = 600
+
+    @staticmethod
+    def get_list_cache_key(params) -> str:
+        return f"list:{urlencode(sorted(params.lists()), doseq=True)}"
+
+    def list(self, request, *args, **kwargs):
+        data = cache.get_or_set(
+            model_namespace(self.queryset.model),
+            self.get_list_cache_key(request.GET),
+            lambda: super(CachedListMixin, self).list(
+                request, *args, **kwargs
+            ).data,
+            self.cache_ttl,
+            self.cache_stale_ttl
+        )
+        return Response(data)
+
+
+class ValuesListMixin:
+    """
+    Serves the 'list' action from the rows of QuerySet.values()
+    converted by the fields of the serializer, which gives the same
+    data as the serializer without creating model instances.
+
+    """
+    def list(self, request, *args, **kwargs):
+        serializer = ValuesSerializer(self.get_serializer())
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *serializer.columns
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(queryset))
+
+
+def apply_batch(request, queryset, link_model, link_field,
+                add=True, excluded_ids=()):
+    """
+    Adds or removes links of the requested user to a list of objects
+    (recipes for favorites and shopping list, authors for subscriptions).
+
+    All requested ids are checked with one query, and the links
+    are created or deleted with one bulk statement.
+
+    Args:
+        request: Request with the list of ids in the body.
+        queryset: Queryset of the objects that can be linked.
+        link_model: Model that stores the link with the user.
+        link_field: Name of the field of link_model pointing to the object.
+        add (bool): Create links if True, otherwise delete them.
+        excluded_ids: Ids of objects that can't be linked.
+
+    Returns:
+        Response with the status of the operation for every id.
+
+    """
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data["ids"]
+    user = request.user
+
+    linked = link_model.objects.filter(
+        user=user, **{link_field: OuterRef("pk")}
+    )
+    found = dict(
+        queryset.filter(id__in=ids).annotate(
+            linked=Exists(linked)
+        ).values_list("id", "linked")
+    )
+
+    results = []
+    changed_ids = []
+    for object_id in ids:
+        if object_id not in found:
+            result = "not_found"
+        elif object_id in excluded_ids:
+            result = "invalid"
+        elif add:
+            result = "exists" if found[object_id] else "created"
+        else:
+            result = "deleted" if found[object_id] else "absent"
+        if result in ("created", "deleted"):
+            changed_ids.append(object_id)
+        results.append({"id": object_id, "status": result})
+
+    if changed_ids:
+        if add:
+            link_model.objects.bulk_create(
+                [link_model(user=user, **{f"{link_field}_id": object_id})
+                 for object_id in changed_ids],
+                ignore_conflicts=True
+            )
+        else:
+            links = link_model.objects.filter(
+                user=user, **{f"{link_field}_id__in": changed_ids}
+            )
+            if link_model in SOURCE_NAMES:
+                record_removals(links)
+            raw_delete(links)
+        # neither bulk_create() nor raw_delete() send the signals
+        cache.bump(user_namespace(user.id))
+        if link_model is FavoriteRecipe:
+            refresh_favorites_count(changed_ids)
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+def prune_recipe_queryset(queryset, request):
+    """
+    Loads the related objects of the recipes in bulk, but only
+    those present in the response, and defers the recipe text
+    when it is not requested.
+
+    Args:
+        queryset: Queryset of recipes.
+        request: Request with the sparse fieldset parameters.
+
+    Returns:
+        queryset: Queryset with select_related and prefetch_related.
+
+    """
+    if is_field_selected(request, "author"):
+        queryset = queryset.select_related("author")
+    if is_field_selected(request, "tags"):
+        queryset = queryset.prefetch_related(Prefetch(
+            "tags", queryset=Tag.objects.order_by(*TAG_ORDERING)
+        ))
+    if is_field_selected(request, "ingredients"):
+        queryset = queryset.prefetch_related(Prefetch(
+            "ingredients_amounts",
+            queryset=RecipeIngredient.objects.select_related(
+                "ingredients"
+            ).order_by(*INGREDIENT_ORDERING)
+        ))
+    if not is_field_selected(request, "text"):
+        queryset = queryset.defer("text")
+    return queryset
+
+
+class ChangesTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = ("The sync token is older than the kept deleted "
+                      "recipes, start the sync again without it.")
+    default_code = "sync_token_expired"
+
+
+def encode_changes_token(cursors, synced) -> str:
+    """
+    Packs the positions of the changes feed and the time up to which
+    the deleted recipes were read into an opaque token.
+    """
+    data = {
+        name: [cursor[0].isoformat(), cursor[1]] if cursor else None
+        for name, cursor in cursors.items()
+    }
+    data["synced"] = synced.isoformat()
+    return urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_changes_token(token):
+    """
+    Unpacks the token of 'encode_changes_token'.
+
+    Args:
+        token: Token from the previous response, or None
+            to start from the beginning.
+
+    Returns:
+        cursors (dict): (timestamp, id) of the last seen change
+        of the recipes and of the deleted recipes.
+        synced (datetime): Time up to which the deleted recipes
+        were read, None without the token.
+
+    """
+    cursors = dict.fromkeys(CHANGES_FEEDS)
+    if not token:
+        return cursors, None
+    try:
+        data = json.loads(urlsafe_b64decode(token.encode()))
+        for name in CHANGES_FEEDS:
+            if data[name] is not None:
+                moment = parse_datetime(data[name][0])
+                if moment is None:
+                    raise ValueError
+                cursors[name] = (moment, int(data[name][1]))
+        if "synced" in data:
+            synced = parse_datetime(data["synced"])
+            if synced is None:
+                raise ValueError
+        else:
+            # the tokens issued before the tombstones were pruned
+            synced = min((cursor[0] for cursor in cursors.values()
+                          if cursor), default=None)
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise ValidationError({"since": ["Invalid sync token."]})
+    return cursors, synced
+
+
+def after_cursor(queryset, field, cursor):
+    """
+    Filters the rows following the cursor in the (field, id) order.
+    """
+    if cursor is None:
+        return queryset
+    moment, pk = cursor
+    return queryset.filter(
+        Q(**{f"{field}__gt": moment}) | Q(**{field: moment, "id__gt": pk})
+    ).order_by(field, "id")
+
+
+def get_user_state(user) -> dict:
+    """
+    Collects the ids of the favorite recipes, the recipes in the
+    shopping list and the followed authors of the user
+    as sorted lists, together with the version of this state.
+
+    Args:
+        user: Authenticated user.
 
+    Returns:
+        state (dict): Lists of ids and their version.
 
-class AppUserViewSet(UserViewSet):
+    """
+    state = {
+        "favorites": list(FavoriteRecipe.objects.filter(
+            user=user
+        ).order_by("recipe_id").values_list("recipe_id", flat=True)),
+        "shopping_cart": list(ShoppingList.objects.filter(
+            user=user
+        ).order_by("recipe_id").values_list("recipe_id", flat=True)),
+        "subscriptions": list(Subscription.objects.filter(
+            user=user
+        ).order_by("author_id").values_list("author_id", flat=True)),
+    }
+    state["version"] = hashlib.md5(
+        json.dumps(state, sort_keys=True).encode()
+    ).hexdigest()
+    return state
+
+
+class AppUserViewSet(StatementTimeoutMixin, ReplicaReadMixin, UserViewSet):
     """
     Viewer class with methods for url
     'users/subscribe', 'users/delete_subscribe', 'users/subscriptions'.
@@ -34,6 +394,28 @@ class AppUserViewSet(UserViewSet):
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     pagination_class = AppPagination
     queryset = User.objects.all()
+    replica_write_actions = ("subscribe",)
+    statement_timeouts = {"list": 2000, "subscriptions": 3000}
+    admission_priorities = {"subscribe_batch": "low"}
+    throttle_scopes = {"subscribe": "subscribe",
+                       "delete_subscribe": "subscribe",
+                       "subscribe_batch": "batch",
+                       "delete_subscribe_batch": "batch"}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if (self.action in ("list", "retrieve") and user.is_authenticated
+                and is_field_selected(self.request, "is_subscribed")):
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author_id=OuterRef("pk")
+                ))
+            )
+        return queryset
+
+    def perform_destroy(self, instance):
+        schedule_deletion(user_ids=[instance.pk])
 
     @action(detail=True, permission_classes=[IsAuthenticated])
     def subscribe(self, request, id=None):
@@ -61,10 +443,52 @@ class AppUserViewSet(UserViewSet):
         subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["post"], url_path="subscribe/batch",
+            permission_classes=[IsAuthenticated])
+    def subscribe_batch(self, request):
+        return apply_batch(
+            request, User.objects.all(), Subscription, "author",
+            excluded_ids={request.user.id}
+        )
+
+    @subscribe_batch.mapping.delete
+    def delete_subscribe_batch(self, request):
+        return apply_batch(
+            request, User.objects.all(), Subscription, "author", add=False
+        )
+
+    @action(detail=False, url_path="me/state",
+            permission_classes=[IsAuthenticated])
+    def state(self, request):
+        state = get_user_state(request.user)
+        etag = f'"{state["version"]}"'
+        if request.META.get("HTTP_IF_NONE_MATCH") == etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(state)
+        response["ETag"] = etag
+        return response
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        queryset = Subscription.objects.filter(user=user)
+        queryset = Subscription.objects.filter(
+            user=user
+        ).select_related("author")
+        if is_field_selected(request, "is_subscribed"):
+            queryset = queryset.annotate(
+                is_subscribed=Value(True, output_field=BooleanField())
+            )
+        if is_field_selected(request, "recipes"):
+            queryset = queryset.prefetch_related(Prefetch(
+                "author__recipes",
+                queryset=Recipe.objects.only(
+                    "id", "name", "image", "cooking_time", "author_id"
+                ),
+                to_attr="subscription_recipes"
+            ))
+        if is_field_selected(request, "recipes_count"):
+            queryset = queryset.annotate(recipes_count=Count("author__recipes"))
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionsSerializer(
             pages,
@@ -74,7 +498,8 @@ class AppUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(StatementTimeoutMixin, ReplicaReadMixin, CachedListMixin,
+                 ValuesListMixin, viewsets.ReadOnlyModelViewSet):
     """
     Viewer class for url 'tags'.
 
@@ -83,9 +508,30 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     pagination_class = None
     queryset = Tag.objects.all()
+    statement_timeouts = {"list": 1000, "retrieve": 1000}
+    admission_priority = "high"
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+def get_cached_tags() -> list:
+    """
+    Returns the tag list under the same cache key as 'tags/'.
+    """
+    def build():
+        serializer = ValuesSerializer(TagSerializer())
+        return serializer.serialize(Tag.objects.values(*serializer.columns))
+
+    return cache.get_or_set(
+        model_namespace(Tag),
+        CachedListMixin.get_list_cache_key(QueryDict()),
+        build,
+        TagViewSet.cache_ttl,
+        TagViewSet.cache_stale_ttl
+    )
+
+
+class IngredientsViewSet(StatementTimeoutMixin, ReplicaReadMixin,
+                         CachedListMixin, ValuesListMixin,
+                         viewsets.ModelViewSet):
     """
     Viewer class for url 'ingredients'.
 
@@ -95,9 +541,12 @@ class IngredientsViewSet(viewsets.ModelViewSet):
     pagination_class = None
     filterset_class = IngredientFilter
     queryset = Ingredient.objects.all()
+    statement_timeouts = {"list": 1000, "retrieve": 1000}
+    admission_priority = "high"
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(StatementTimeoutMixin, ReplicaReadMixin,
+                    viewsets.ModelViewSet):
     """
     Main viewer class with methods for url
     'recipes/', 'recipes/favorite', 'recipes/delete_favorite' and others.
@@ -108,13 +557,246 @@ class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = AppPagination
     filter_class = RecipeFilter
     queryset = Recipe.objects.all()
+    replica_write_actions = ("favorite", "shopping_cart")
+    statement_timeouts = {"list": 3000, "retrieve": 2000, "facets": 3000,
+                          "changes": 3000, "similar": 2000, "pantry": 3000,
+                          "download_shopping_cart": 15000}
+    admission_priorities = {"retrieve": "high",
+                            "download_shopping_cart": "low",
+                            "favorite_batch": "low",
+                            "shopping_cart_batch": "low"}
+    throttle_scopes = {"create": "recipe_write",
+                       "update": "recipe_write",
+                       "partial_update": "recipe_write",
+                       "favorite": "favorite",
+                       "delete_favorite": "favorite",
+                       "shopping_cart": "shopping_cart",
+                       "delete_shopping_cart": "shopping_cart",
+                       "favorite_batch": "batch",
+                       "delete_favorite_batch": "batch",
+                       "shopping_cart_batch": "batch",
+                       "delete_shopping_cart_batch": "batch",
+                       "clear_shopping_cart": "batch",
+                       "download_shopping_cart": "download"}
 
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        delete_recipes([instance.pk])
+
     def get_queryset(self):
         queryset = self.filter_class.filter_recipe_queryset(self.request)
-        return queryset
+        return prune_recipe_queryset(queryset, self.request)
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, "_paginator") and self.action == "list"
+                and self.request.GET.get("ordering") == "popular"):
+            self._paginator = KeysetPagination("popularity")
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        """
+        Builds the page from QuerySet.values() rows with one query
+        for each kind of related objects (see 'serialize_recipes'),
+        which gives the same data as RecipeSerializer.
+
+        """
+        serializer = self.get_serializer()
+        queryset = self.filter_queryset(
+            self.filter_class.filter_recipe_queryset(request)
+        )
+        columns = recipe_columns(serializer, queryset)
+        columns += getattr(self.paginator, "keyset_fields", ())
+        rows = queryset.values(*dict.fromkeys(columns))
+        if IDS_PARAM in request.GET:
+            return self.list_by_ids(request, serializer, rows)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                serialize_recipes(serializer, page, request)
+            )
+        return Response(serialize_recipes(serializer, rows, request))
+
+    def list_by_ids(self, request, serializer, rows):
+        """
+        Returns the recipes requested with '?ids=1,5,9' in the order
+        of the request, without pagination, together with the ids
+        that were not found (or don't match the other filters).
+
+        """
+        ids_serializer = BatchIdsSerializer(
+            data={"ids": request.GET[IDS_PARAM].split(",")}
+        )
+        ids_serializer.is_valid(raise_exception=True)
+        ids = ids_serializer.validated_data["ids"]
+        rows = {row["id"]: row for row in rows.filter(id__in=ids)}
+        results = serialize_recipes(
+            serializer, [rows[pk] for pk in ids if pk in rows], request
+        )
+        return Response({
+            "results": results,
+            "missing": [pk for pk in ids if pk not in rows],
+        })
+
+    @action(detail=False)
+    def facets(self, request):
+        """
+        Returns the number of recipes for every value of the filters
+        (tags, authors, favorites and shopping list) given the other
+        filters of the request, e.g. for 'recipes/facets/?tags=lunch'.
+        Only the authors with the most recipes are listed
+        (see FACET_AUTHORS_LIMIT).
+
+        The counts are cached per filters, in the recipe namespace
+        and, for a logged in user, in the namespace of the user.
+
+        """
+        user = request.user
+        params = urlencode(sorted(request.GET.lists()), doseq=True)
+        if user.is_authenticated:
+            namespace = user_namespace(user.id)
+            owner = f"{user.id}:v{cache.namespace_version(namespace)}"
+        else:
+            owner = "anonymous"
+        counts = cache.get_or_set(
+            model_namespace(Recipe),
+            f"facets:{owner}:{params}",
+            lambda: self.filter_class.count_facets(request),
+            CachedListMixin.cache_ttl,
+            CachedListMixin.cache_stale_ttl
+        )
+        authors = sorted(
+            counts["author"].items(), key=lambda item: (-item[1], item[0])
+        )
+        return Response({
+            "total": counts["total"][0],
+            "tags": [
+                {"id": tag["id"], "slug": tag["slug"],
+                 "count": counts["tags"].get(tag["id"], 0)}
+                for tag in get_cached_tags()
+            ],
+            "authors": [{"id": author_id, "count": count}
+                        for author_id, count in authors],
+            "is_favorited": counts["is_favorited"][0],
+            "is_in_shopping_cart": counts["is_in_shopping_cart"][0],
+        })
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        Returns the recipes created or updated and the ids of the
+        recipes deleted after the position of the 'since' token,
+        at most 'limit' of each, and the token of the new position.
+        Without the token the feed starts from the beginning.
+        The tokens which haven't read the deleted recipes for longer
+        than their retention (see 'tombstone_cutoff') are refused
+        with 410: their tombstones may be removed already.
+
+        """
+        cursors, synced = decode_changes_token(request.GET.get("since"))
+        if synced is not None and synced < tombstone_cutoff():
+            raise ChangesTokenExpired()
+        limit = self.paginator.get_page_size(request)
+        settled = settled_before(CHANGES_SETTLE_SECONDS)
+
+        serializer = self.get_serializer()
+        queryset = self.filter_queryset(
+            self.filter_class.filter_recipe_queryset(request)
+        ).filter(updated__lte=settled).order_by("updated", "id")
+        queryset = after_cursor(queryset, "updated", cursors["recipes"])
+        columns = recipe_columns(serializer, queryset)
+        rows = list(queryset.values(
+            *dict.fromkeys([*columns, "updated"])
+        )[:limit + 1])
+
+        tombstones = RecipeTombstone.objects.filter(
+            deleted__lte=settled
+        ).order_by("deleted", "id")
+        tombstones = after_cursor(tombstones, "deleted", cursors["deleted"])
+        deleted = list(tombstones.values("id", "recipe_id", "deleted")[
+            :limit + 1
+        ])
+
+        has_more = len(rows) > limit or len(deleted) > limit
+        if len(deleted) > limit:
+            synced = deleted[limit - 1]["deleted"]
+        else:
+            synced = settled
+        rows, deleted = rows[:limit], deleted[:limit]
+        if rows:
+            cursors["recipes"] = (rows[-1]["updated"], rows[-1]["id"])
+        if deleted:
+            cursors["deleted"] = (deleted[-1]["deleted"], deleted[-1]["id"])
+        return Response({
+            "recipes": serialize_recipes(serializer, rows, request),
+            "deleted": [row["recipe_id"] for row in deleted],
+            "next": encode_changes_token(cursors, synced),
+            "has_more": has_more,
+        })
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """
+        Returns at most 'limit' recipes with the most common ingredients
+        (see 'similar_recipes'), the most similar first, each with
+        its 'similarity' from 0 to 1.
+
+        """
+        recipe = get_object_or_404(Recipe.objects.only("id"), id=pk)
+        similar = dict(similar_recipes(
+            recipe.id, self.paginator.get_page_size(request)
+        ))
+        results = []
+        for recipe_id, data in self.serialize_by_ids(request, similar):
+            data["similarity"] = round(similar[recipe_id], 4)
+            results.append(data)
+        return Response({"results": results})
+
+    @action(detail=False)
+    def pantry(self, request):
+        """
+        Returns the page of the recipes that can be cooked from the
+        ingredients of 'recipes/pantry/?ingredients=1,5,9' missing
+        at most 'max_missing' of their own ingredients (0 by default),
+        see 'match_pantry', each with the number of its
+        'missing' ingredients.
+
+        """
+        query = PantrySerializer(data={
+            "ingredients": request.GET.get("ingredients", "").split(","),
+            "max_missing": request.GET.get("max_missing", 0),
+        })
+        query.is_valid(raise_exception=True)
+        ids, missing = pantry_recipes(
+            query.validated_data["ingredients"],
+            query.validated_data["max_missing"]
+        )
+        # the page is taken from the positions in the ranked arrays
+        positions = self.paginate_queryset(np.arange(len(ids)))
+        missing = dict(zip(ids[positions].tolist(),
+                           missing[positions].tolist()))
+        results = []
+        for recipe_id, data in self.serialize_by_ids(request, missing):
+            data["missing"] = missing[recipe_id]
+            results.append(data)
+        return self.get_paginated_response(results)
+
+    def serialize_by_ids(self, request, ids) -> list:
+        """
+        Returns the pairs (id, data) of the recipes with the ids
+        in the given order, skipping the recipes that are not found.
+        """
+        serializer = self.get_serializer()
+        queryset = self.filter_class.filter_recipe_queryset(request)
+        rows = {row["id"]: row for row in queryset.filter(
+            id__in=ids
+        ).values(*recipe_columns(serializer, queryset))}
+        rows = [rows[recipe_id] for recipe_id in ids if recipe_id in rows]
+        return [(row["id"], data) for row, data in zip(
+            rows, serialize_recipes(serializer, rows, request)
+        )]
 
     @action(detail=True, permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -170,6 +852,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
         favorites.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["post"], url_path="favorite/batch",
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return apply_batch(
+            request, Recipe.objects.all(), FavoriteRecipe, "recipe"
+        )
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return apply_batch(
+            request, Recipe.objects.all(), FavoriteRecipe, "recipe", add=False
+        )
+
+    @action(detail=False, methods=["post"], url_path="shopping_cart/batch",
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return apply_batch(
+            request, Recipe.objects.all(), ShoppingList, "recipe"
+        )
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return apply_batch(
+            request, Recipe.objects.all(), ShoppingList, "recipe", add=False
+        )
+
+    @action(detail=False, methods=["delete"], url_path="shopping_cart",
+            permission_classes=[IsAuthenticated])
+    def clear_shopping_cart(self, request):
+        links = ShoppingList.objects.filter(user=request.user)
+        record_removals(links)
+        raw_delete(links)
+        cache.bump(user_namespace(request.user.id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
         items = RecipeIngredient.objects.select_related(
@@ -191,3 +908,74 @@ class RecipeViewSet(viewsets.ModelViewSet):
         response = HttpResponse(shop_string, content_type="text/plain")
         response["Content-Disposition"] = f"attachment; filename={filename}"
         return response
+
+
+class BootstrapViewSet(StatementTimeoutMixin, ReplicaReadMixin,
+                       viewsets.ViewSet):
+    """
+    Viewer class for url 'bootstrap/': everything the client needs
+    on startup in one response - the tags, the current user,
+    the first page of recipes and the state of the user.
+
+    The tags are shared with the cached tag list, and the recipe page
+    of anonymous users is cached as well. The query parameters
+    ('limit', filters, 'fields') are applied to the recipe page.
+
+    """
+    permission_classes = (AllowAny,)
+    statement_timeouts = {"list": 3000}
+    admission_priority = "high"
+
+    def list(self, request):
+        user = request.user
+        data = {
+            "tags": get_cached_tags(),
+            "me": None,
+            "recipes": None,
+            "state": None,
+        }
+        if user.is_authenticated:
+            data["me"] = djoser_settings.SERIALIZERS.current_user(
+                user, context=self.get_serializer_context()
+            ).data
+            data["recipes"] = self.get_recipes_page(request)
+            data["state"] = get_user_state(user)
+        else:
+            params = urlencode(sorted(request.GET.lists()), doseq=True)
+            data["recipes"] = cache.get_or_set(
+                model_namespace(Recipe),
+                f"bootstrap:{request.get_host()}:{params}",
+                lambda: self.get_recipes_page(request),
+                CachedListMixin.cache_ttl,
+                CachedListMixin.cache_stale_ttl
+            )
+        return Response(data)
+
+    def get_serializer_context(self):
+        return {"request": self.request, "format": None, "view": self}
+
+    @staticmethod
+    def get_recipes_page(request):
+        """
+        Runs the list action of RecipeViewSet for the request,
+        as if it was sent to 'recipes/', so the pagination links
+        point to the recipe list.
+
+        """
+        http_request = copy.copy(request._request)
+        http_request.path = http_request.path_info = reverse(
+            "recipes:recipes-list"
+        )
+        recipes_request = Request(
+            http_request, parsers=request.parsers,
+            authenticators=request.authenticators,
+            negotiator=request.negotiator,
+            parser_context=request.parser_context
+        )
+        recipes_request.user = request.user
+        recipes_request.auth = request.auth
+        view = RecipeViewSet(
+            request=recipes_request, args=(), kwargs={},
+            format_kwarg=None, action="list", headers={}
+        )
+        return view.list(recipes_request).data
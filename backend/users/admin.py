@@ -1,7 +1,10 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
 
+from foodgram.db import EstimatedCountPaginator
+from recipes.deletion import (count_deleted_rows, deletion_perms_needed,
+                              deletion_summary, schedule_deletion)
 from .models import AppUser
 from .forms import UserCreationForm, UserChangeForm
 
@@ -32,6 +35,35 @@ class UserAdmin(BaseUserAdmin):
     search_fields = ("email",)
     ordering = ("email",)
     filter_horizontal = ()
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_deleted_objects(self, objs, request):
+        """
+        Shows the numbers of the related rows on the confirmation page
+        instead of collecting every recipe, favorite and subscription,
+        and the ones the staff user may not delete.
+        """
+        objs = list(objs)
+        counts = count_deleted_rows(user_ids=[obj.pk for obj in objs])
+        perms_needed = deletion_perms_needed(request, self.admin_site, counts)
+        return ([str(obj) for obj in objs], deletion_summary(counts),
+                perms_needed, [])
+
+    def delete_model(self, request, obj):
+        self.schedule_deletion(request, [obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        self.schedule_deletion(request, queryset.values_list("id", flat=True))
+
+    def schedule_deletion(self, request, user_ids):
+        schedule_deletion(user_ids=list(user_ids))
+        self.message_user(
+            request,
+            "The users are deactivated and will be deleted "
+            "with their data by 'process_deletions'.",
+            messages.INFO
+        )
 
 
 admin.site.register(AppUser, UserAdmin)
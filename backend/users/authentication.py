@@ -0,0 +1,161 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from foodgram.utils import LRUCache
+from monitoring.metrics import CACHE_EVENTS
+
+from .models import AppUser
+
+# Fields of the user loaded from the cache, in the order of the model
+# fields as expected by Model.from_db(); the other fields are loaded
+# from the database on first access.
+SNAPSHOT_FIELDS = tuple(
+    field.attname for field in AppUser._meta.concrete_fields
+    if field.attname in ("id", "email", "username", "first_name",
+                         "last_name", "is_active", "is_staff",
+                         "is_superuser", "is_admin")
+)
+
+CACHE_SETTINGS = {
+    "MAX_SIZE": 10000,
+    "LOCAL_TTL": 10,
+    "VERSION_TTL": 2,
+    "TTL": 300,
+    "CACHE_ALIAS": settings.SHARED_CACHE_ALIAS,
+    "KEY_PREFIX": "auth-token",
+}
+CACHE_SETTINGS.update(getattr(settings, "TOKEN_AUTH_CACHE", {}))
+
+local_cache = LRUCache(
+    max_size=CACHE_SETTINGS["MAX_SIZE"], ttl=CACHE_SETTINGS["LOCAL_TTL"]
+)
+# revocation versions of the users read from the shared cache
+local_versions = LRUCache(
+    max_size=CACHE_SETTINGS["MAX_SIZE"], ttl=CACHE_SETTINGS["VERSION_TTL"]
+)
+
+
+def get_shared_cache():
+    return caches[CACHE_SETTINGS["CACHE_ALIAS"]]
+
+
+def get_cache_key(key: str) -> str:
+    return f"{CACHE_SETTINGS['KEY_PREFIX']}:{key}"
+
+
+def get_version_key(user_id: int) -> str:
+    return f"{CACHE_SETTINGS['KEY_PREFIX']}:user:{user_id}"
+
+
+def get_user_version(user_id: int) -> int:
+    """
+    Returns the revocation version of the user, read from the shared
+    cache at most once per VERSION_TTL seconds in the worker: a token
+    revoked in another worker is accepted here for VERSION_TTL seconds
+    at most.
+    """
+    version = local_versions.get(user_id)
+    if version is None:
+        version = get_shared_cache().get(get_version_key(user_id), 0)
+        local_versions.set(user_id, version)
+    return version
+
+
+def bump_user_version(user_id: int):
+    """
+    Revokes the cached tokens of the user in every worker: the cached
+    entries keep the version they were made with and are discarded
+    when it is no longer the current one.
+    """
+    shared_cache = get_shared_cache()
+    key = get_version_key(user_id)
+    try:
+        version = shared_cache.incr(key)
+    except ValueError:
+        version = 1
+        shared_cache.set(key, version, None)
+    local_versions.set(user_id, version)
+
+
+def make_snapshot(user: AppUser) -> tuple:
+    return tuple(getattr(user, field) for field in SNAPSHOT_FIELDS)
+
+
+def user_from_snapshot(snapshot: tuple) -> AppUser:
+    """
+    Builds the user instance from the cached values without
+    a database query. Only the loaded fields are written on save,
+    so the instance is safe to use for password or profile updates.
+    """
+    return AppUser.from_db(DEFAULT_DB_ALIAS, SNAPSHOT_FIELDS, snapshot)
+
+
+def invalidate_token(key: str, user_id: int):
+    local_cache.delete(key)
+    get_shared_cache().delete(get_cache_key(key))
+    bump_user_version(user_id)
+
+
+def invalidate_user(user_id: int):
+    """
+    Revokes all cached tokens of the user,
+    e.g. after a password change or deactivation.
+    """
+    local_cache.delete_many(lambda entry: entry[1][0] == user_id)
+    bump_user_version(user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that keeps a snapshot of the token owner
+    in the in-process LRU cache and in the shared cache, so that
+    the Token and AppUser tables are not queried on every request.
+
+    Every entry holds the revocation version of the user, which is
+    checked on every request (see 'get_user_version'): logout, token
+    deletion and any save of the user (password change, deactivation)
+    bump the version and so revoke the entries at once in the worker
+    and within VERSION_TTL seconds in the others.
+    """
+
+    def get_entry(self, key, version_of):
+        entry = local_cache.get(key)
+        if entry is not None:
+            if entry[0] == version_of(entry[1][0]):
+                CACHE_EVENTS.labels("token_auth", "local_hits").inc()
+                return entry
+            local_cache.delete(key)
+        entry = get_shared_cache().get(get_cache_key(key))
+        if entry is not None and entry[0] == version_of(entry[1][0]):
+            CACHE_EVENTS.labels("token_auth", "shared_hits").inc()
+            local_cache.set(key, entry)
+            return entry
+        return None
+
+    def authenticate_credentials(self, key):
+        versions = {}
+
+        def version_of(user_id):
+            if user_id not in versions:
+                versions[user_id] = get_user_version(user_id)
+            return versions[user_id]
+
+        entry = self.get_entry(key, version_of)
+        if entry is None:
+            CACHE_EVENTS.labels("token_auth", "misses").inc()
+            user, token = super().authenticate_credentials(key)
+            entry = (version_of(user.pk), make_snapshot(user))
+            get_shared_cache().set(
+                get_cache_key(key), entry, CACHE_SETTINGS["TTL"]
+            )
+            local_cache.set(key, entry)
+            return user, token
+
+        user = user_from_snapshot(entry[1])
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        return user, Token(key=key, user=user)
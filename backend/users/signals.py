@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user
+from .models import AppUser
+
+
+# The revocations are published after the commit, so the workers
+# that see them load the changed rows from the database.
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: invalidate_token(instance.key, instance.user_id)
+    )
+
+
+@receiver(post_save, sender=AppUser)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: invalidate_user(instance.pk))
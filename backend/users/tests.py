@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from recipes.tests.base import isolated_caches
+
+from .authentication import (CachedTokenAuthentication, get_cache_key,
+                             get_shared_cache, get_version_key, local_cache,
+                             local_versions)
+from .models import AppUser
+
+
+@isolated_caches
+class CachedTokenAuthenticationTest(TestCase):
+    """
+    The cached entries of a token are revoked in every worker: the other
+    workers are simulated by putting the entries they still hold back
+    into the local cache after the revocation.
+    """
+
+    def setUp(self):
+        local_cache.clear()
+        local_versions.clear()
+        get_shared_cache().clear()
+        self.user = AppUser.objects.create_user(
+            email="user@example.com", username="user", first_name="Имя",
+            last_name="Фамилия", password="pass-12345"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.auth.authenticate_credentials(self.token.key)
+
+    def cached_entries(self):
+        return (local_cache.get(self.token.key),
+                get_shared_cache().get(get_cache_key(self.token.key)))
+
+    def restore(self, entries):
+        local_entry, shared_entry = entries
+        local_cache.set(self.token.key, local_entry)
+        get_shared_cache().set(get_cache_key(self.token.key), shared_entry)
+
+    def test_cached_token_skips_database_and_shared_cache(self):
+        self.authenticate()
+        with self.assertNumQueries(0), mock.patch(
+            "users.authentication.get_shared_cache"
+        ) as get_shared_cache:
+            user, token = self.authenticate()
+        get_shared_cache.assert_not_called()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_deactivation_revokes_entries_of_other_workers(self):
+        self.authenticate()
+        entries = self.cached_entries()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.restore(entries)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_token_deletion_revokes_entries_of_other_workers(self):
+        self.authenticate()
+        entries = self.cached_entries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.restore(entries)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_other_users_stay_cached(self):
+        self.authenticate()
+        other = AppUser.objects.create_user(
+            email="other@example.com", username="other", first_name="Имя",
+            last_name="Фамилия", password="pass-12345"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_other_workers_see_revocation_within_version_ttl(self):
+        self.authenticate()
+        # revoked by another worker: the version in this one is not stale
+        AppUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        get_shared_cache().set(get_version_key(self.user.pk), 1, None)
+        with self.assertNumQueries(0):
+            self.authenticate()
+        # VERSION_TTL later
+        local_versions.clear()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()